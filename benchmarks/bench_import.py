@@ -0,0 +1,71 @@
+# bench_import.py
+"""
+Cold-start cost of the web process: how long `import main` takes in a fresh
+interpreter, which modules dominate, and whether any heavy client (Playwright,
+Firestore, OpenAI) got pulled in at import time — none of them should.
+
+    python benchmarks/bench_import.py --runs 10 --output import.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("playwright", "firebase_admin", "google.cloud.firestore_v1", "openai")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def time_import(module: str):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def top_modules(module: str, n: int):
+    """Largest cumulative entries from `python -X importtime`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2  # importtime indents nested imports
+        rows.append({"module": name.strip(), "depth": depth,
+                     "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    # direct imports of the probed module (depth 1) say where its own import time goes
+    direct = [r for r in rows if r["depth"] == 1]
+    return sorted(direct, key=lambda r: r["cumulative_ms"], reverse=True)[:n]
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Measure import-time cost of the FastAPI entrypoint.")
+    ap.add_argument("--module", default="main")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = ap.parse_args()
+
+    samples = [time_import(args.module) for _ in range(args.runs)]
+    seconds = sorted(s["seconds"] for s in samples)
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "p50_s": round(statistics.median(seconds), 4),
+        "max_s": round(seconds[-1], 4),
+        "heavy_modules_loaded": sorted({m for s in samples for m in s["loaded"]}),
+        "top_imports": top_modules(args.module, args.top),
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
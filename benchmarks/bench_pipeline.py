@@ -0,0 +1,275 @@
+# bench_pipeline.py
+"""
+Offline benchmark for clean → normalise → screen → save.
+
+Replays hotel_data/*.json, scaled up by shifting each file across `--copies` dates,
+through:
+  clean      clean_with_openai.clean_with_gpt with a deterministic fake OpenAI client
+  normalise  main.normalize_cleaned_files (the block run() uses before saving)
+  screen     utils.anomalies.screen_prices + split_rows over the sweep (no stored history)
+  save       save_nested.save_cleaned_rows_nested against an in-memory Firestore
+
+Prints one JSON document (rows/sec, p50/p95 per stage, peak memory) so results can
+be tracked across commits:
+
+    python benchmarks/bench_pipeline.py --copies 100 --repeat 5 --latency 0.02 --output bench.json
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+import clean_with_openai as cleaner
+import main
+from raw_store import SegmentWriter
+from save_nested import save_cleaned_rows_nested
+from utils.anomalies import screen_prices, split_rows
+
+# ============== Fakes ==============
+class FakeOpenAI:
+    """Answers like the classifier prompt expects, after `latency` seconds, with no network."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: List[Dict[str, str]], **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        room = re.search(r"^Room: (.*)$", prompt, re.M).group(1).lower()
+        meal = re.search(r"^Meal plan: (.*)$", prompt, re.M).group(1).lower()
+        options = sorted(re.findall(r"^- (.*)$", prompt, re.M))
+
+        answer = "ignore"
+        for opt in options:
+            m = re.match(r"(.*?)\s*[-–]?\s*(ro|bb)$", opt.lower())
+            if not m:
+                continue
+            name, opt_meal = m.groups()
+            words = [w for w in re.findall(r"[a-z]+", name) if w != "standard"]
+            if opt_meal == meal and all(w in room for w in words):
+                answer = opt.lower()
+                break
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+class FakeFirestore:
+    """Just enough of the Firestore client surface for save_cleaned_rows_nested."""
+
+    class _Ref:
+        def __init__(self, path):
+            self.path = path
+
+        def collection(self, name):
+            return FakeFirestore._Ref(self.path + (name,))
+
+        def document(self, name):
+            return FakeFirestore._Ref(self.path + (name,))
+
+    class _Batch:
+        def __init__(self, store):
+            self.store = store
+            self.ops = []
+
+        def set(self, ref, payload, merge=False):
+            self.ops.append((ref.path, payload, merge))
+
+        def commit(self):
+            for path, payload, merge in self.ops:
+                key = "/".join(path)
+                if merge:
+                    FakeFirestore._merge(self.store.setdefault(key, {}), payload)
+                else:
+                    self.store[key] = copy.deepcopy(payload)
+            self.ops = []
+
+    @staticmethod
+    def _merge(target: Dict[str, Any], payload: Dict[str, Any]):
+        """set(merge=True) semantics: nested maps merge key by key, everything else replaces."""
+        for k, v in payload.items():
+            if isinstance(v, dict) and isinstance(target.get(k), dict):
+                FakeFirestore._merge(target[k], v)
+            else:
+                target[k] = copy.deepcopy(v)
+
+    def __init__(self):
+        self.store: Dict[str, Dict[str, Any]] = {}
+
+    def collection(self, name):
+        return FakeFirestore._Ref((name,))
+
+    def batch(self):
+        return FakeFirestore._Batch(self.store)
+
+    def get_all(self, refs):
+        for ref in refs:
+            doc = self.store.get("/".join(ref.path))
+            yield SimpleNamespace(exists=doc is not None, to_dict=lambda doc=doc: dict(doc or {}))
+
+# ============== Corpus ==============
+def build_corpus(src: Path, dst: Path, copies: int, seed: int, raw_format: str = "json") -> int:
+    """Write `copies` date-shifted, price-jittered variants of every raw file; return row count."""
+    rng = random.Random(seed)
+    rows_total = 0
+    writer = SegmentWriter(dst, prefix="bench", max_jobs=200, durable=False) if raw_format == "segments" else None
+    sources = sorted(src.glob("*.json"))
+    days = [datetime.strptime(fp.stem.rsplit("_", 1)[1], "%d-%m-%Y") for fp in sources]
+    stride = (max(days) - min(days)).days + 1 if days else 1  # copies never overwrite each other
+    for fp, base in zip(sources, days):
+        records = json.loads(fp.read_text(encoding="utf-8"))
+        if not records:
+            continue
+        hotel_part = fp.stem.rsplit("_", 1)[0]
+        for k in range(copies):
+            day = base + timedelta(days=k * stride)
+            shifted = []
+            for r in records:
+                r = dict(r)
+                r["D"] = day.strftime("%d/%m/%Y")
+                price = main.price_to_float(r.get("P"))
+                if price is not None:
+                    r["P"] = f"{price * rng.uniform(0.95, 1.05):.2f}"
+                shifted.append(r)
+            if writer:
+                next_day = (day + timedelta(days=1)).strftime("%d/%m/%Y")
+                writer.append(shifted[0]["H"], shifted[0]["C"], shifted[0]["D"], next_day, shifted)
+            else:
+                (dst / f"{hotel_part}_{day.strftime('%d-%m-%Y')}.json").write_text(
+                    json.dumps(shifted, ensure_ascii=False), encoding="utf-8")
+            rows_total += len(shifted)
+    if writer:
+        writer.close()
+    return rows_total
+
+# ============== Stages ==============
+def stage_clean(raw_dir: Path, clean_dir: Path, fake: FakeOpenAI):
+    shutil.rmtree(clean_dir, ignore_errors=True)
+    cleaner.classification_cache.clear()  # every repeat starts cold
+    cleaner.client = fake
+    asyncio.run(cleaner.clean_with_gpt(str(raw_dir), str(clean_dir)))
+
+def stage_normalise(clean_dir: Path, hotel_to_city: Dict[str, str]):
+    return main.normalize_cleaned_files(clean_dir, hotel_to_city)
+
+def stage_screen(rows: List[Dict[str, Any]]):
+    return split_rows(rows, screen_prices(rows))
+
+def stage_save(rows: List[Dict[str, Any]]):
+    return save_cleaned_rows_nested(rows, client=FakeFirestore())
+
+def measure(fn: Callable[[], Any], repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def peak_memory_mb(fn: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def summarize(rows: int, timings: List[float], peak_mb: float) -> Dict[str, Any]:
+    ordered = sorted(timings)
+    p50 = statistics.median(ordered)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "rows": rows,
+        "runs": len(timings),
+        "p50_s": round(p50, 6),
+        "p95_s": round(p95, 6),
+        "rows_per_s": round(rows / p50, 1) if p50 else None,
+        "peak_mem_mb": round(peak_mb, 2),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+# ============== Entrypoint ==============
+def main_cli():
+    ap = argparse.ArgumentParser(description="Benchmark the clean → normalise → screen → save path offline.")
+    ap.add_argument("--source", default=str(ROOT / "hotel_data"), help="Raw corpus to replay")
+    ap.add_argument("--copies", type=int, default=20, help="Date-shifted copies of every raw file")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed runs per stage")
+    ap.add_argument("--latency", type=float, default=0.0, help="Fake OpenAI latency per call (seconds)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--raw-format", choices=("json", "segments"), default="json",
+                    help="Replay the corpus as legacy per-file JSON or as raw_store segments")
+    ap.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = ap.parse_args()
+
+    for name in ("cleaner", "scraper", "catalog"):
+        logging.getLogger(name).setLevel(logging.ERROR)  # keep stdout for the report
+
+    work = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    try:
+        raw_dir, clean_dir = work / "hotel_data", work / "cleaned_data"
+        raw_dir.mkdir()
+        cleaner.cache_file = str(work / "classification_cache.json")
+
+        raw_rows = build_corpus(Path(args.source), raw_dir, args.copies, args.seed, args.raw_format)
+        config = json.loads((ROOT / "august_config_by_city_v2.json").read_text(encoding="utf-8"))
+        hotel_to_city = main.build_hotel_to_city_map(config)
+        fake = FakeOpenAI(args.latency)
+
+        clean_t, _ = measure(lambda: stage_clean(raw_dir, clean_dir, fake), args.repeat)
+        gpt_calls = fake.calls // max(1, args.repeat)
+        cleaned_rows = sum(len(json.loads(fp.read_text(encoding="utf-8"))) for fp in clean_dir.glob("*.json"))
+        norm_t, normalized = measure(lambda: stage_normalise(clean_dir, hotel_to_city), args.repeat)
+        screen_t, _ = measure(lambda: stage_screen(normalized), args.repeat)
+        save_t, _ = measure(lambda: stage_save(normalized), args.repeat)
+
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {"copies": args.copies, "repeat": args.repeat, "latency_s": args.latency,
+                       "files": len(list(raw_dir.iterdir())), "seed": args.seed,
+                       "raw_format": args.raw_format},
+            "stages": {
+                "clean": {**summarize(raw_rows, clean_t,
+                                      peak_memory_mb(lambda: stage_clean(raw_dir, clean_dir, fake))),
+                          "gpt_calls": gpt_calls},
+                "normalise": summarize(cleaned_rows, norm_t,
+                                       peak_memory_mb(lambda: stage_normalise(clean_dir, hotel_to_city))),
+                "screen": summarize(len(normalized), screen_t, peak_memory_mb(lambda: stage_screen(normalized))),
+                "save": summarize(len(normalized), save_t, peak_memory_mb(lambda: stage_save(normalized))),
+            },
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main_cli()
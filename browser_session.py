@@ -0,0 +1,174 @@
+# browser_session.py
+"""
+Tab and context lifecycle for long scrape sweeps.
+
+    session = BrowserSession(lambda: launch_browser(p, CHROME_PROFILE_PATH), prepare=sign_in)
+    await session.start()
+    async with session.job() as (page, context):
+        await scrape_job(page, context, ...)
+    await session.close()
+
+Every tab a job opens (details tabs, popups, a late tab from a retried click) is
+recorded through the context's "page" event. When the job ends, however it ends,
+every tab except the search page is closed. Every `sample_every` jobs the session
+samples the open tab count and browser memory:
+- USS of the browser's child processes, when the optional psutil package is installed
+  (pip install psutil; not in requirements.txt)
+  (memory unique to each process, so pages shared between Chrome's processes are not
+  counted once per process as summed RSS would; shared memory is left out entirely,
+  so this is a lower bound of what closing the browser frees)
+- the search page's JS heap, via CDP, otherwise
+
+The context is closed and relaunched once it has served `max_jobs` jobs or memory
+passes `max_memory_mb`. With a persistent profile the session cookies survive the
+relaunch; `prepare` (sign_in) runs again on the new search page.
+
+A job that loads many pages in one tab (calendar mode: one hotel, every date) passes
+job(weight=<dates>) so both budgets count page loads rather than hotels; the checks
+still run only between jobs, never under an open tab.
+"""
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.metrics import get_logger, log_event, BROWSER_TABS, BROWSER_MEMORY_MB, CONTEXT_RECYCLES
+
+try:
+    import psutil
+except ImportError:  # optional dependency
+    psutil = None
+
+log = get_logger("scraper")
+
+RECYCLE_AFTER_JOBS = int(os.getenv("RECYCLE_AFTER_JOBS", "200"))
+RECYCLE_MEMORY_MB = float(os.getenv("RECYCLE_MEMORY_MB", "2000"))
+
+class BrowserSession:
+    def __init__(self, launch: Callable[[], Awaitable[Any]],
+                 prepare: Optional[Callable[[Any], Awaitable[Any]]] = None,
+                 max_jobs: int = RECYCLE_AFTER_JOBS, max_memory_mb: float = RECYCLE_MEMORY_MB,
+                 sample_every: int = 10, name: str = "main"):
+        self.launch = launch
+        self.prepare = prepare
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.sample_every = sample_every
+        self.name = name
+        self.context = None
+        self.page = None
+        self.jobs = 0           # jobs served by the current context (weighted)
+        self.total_jobs = 0
+        self._since_sample = 0
+        self.recycles = 0
+        self._opened: List[Any] = []
+
+    async def start(self):
+        self.context = await self.launch()
+        self.context.on("page", self._opened.append)
+        self.page = await self.context.new_page()
+        self._opened.clear()
+        # a persistent context starts with a blank tab; only the search page is kept
+        await self._close_pages(p for p in self.context.pages if p is not self.page)
+        if self.prepare is not None:
+            await self.prepare(self.page)
+        self.jobs = 0
+
+    async def close(self):
+        if self.context is not None:
+            try:
+                await self.context.close()
+            except Exception as e:
+                log_event(log, "context_close_failed", logging.WARNING, session=self.name, error=str(e))
+            self.context = self.page = None
+
+    @asynccontextmanager
+    async def job(self, weight: int = 1):
+        """
+        (page, context) for one job; stray tabs are closed and recycling checked afterwards.
+        `weight` is how many jobs it counts as towards max_jobs and sample_every.
+        """
+        if self.context is None:
+            await self.start()
+        self._opened.clear()
+        try:
+            yield self.page, self.context
+        finally:
+            self.jobs += weight
+            self.total_jobs += weight
+            self._since_sample += weight
+            try:
+                await self._cleanup()
+            except Exception as e:
+                # raising here would replace the job's own exception; the next job()
+                # starts a fresh context instead
+                log_event(log, "job_cleanup_failed", logging.ERROR, session=self.name, error=str(e)[:300])
+                await self.close()
+
+    async def _cleanup(self):
+        stray = [p for p in self._opened if p is not self.page]
+        stray += [p for p in self.context.pages if p is not self.page and p not in stray]
+        leaked = await self._close_pages(stray)
+        if leaked:
+            log_event(log, "tabs_closed_after_job", session=self.name, tabs=leaked)
+        self._opened.clear()
+        await self._after_job()
+
+    async def _close_pages(self, pages) -> int:
+        closed = 0
+        for p in pages:
+            if p.is_closed():
+                continue
+            try:
+                await p.close()
+                closed += 1
+            except Exception as e:
+                log_event(log, "tab_close_failed", logging.WARNING, session=self.name, error=str(e))
+        return closed
+
+    async def sample(self) -> Dict[str, Optional[float]]:
+        """Open tabs plus browser memory (USS with psutil, else the search page's JS heap)."""
+        stats: Dict[str, Optional[float]] = {"tabs": len(self.context.pages), "uss_mb": None, "js_heap_mb": None}
+        if psutil is not None:
+            uss = 0
+            for child in psutil.Process().children(recursive=True):
+                try:
+                    uss += child.memory_full_info().uss
+                except psutil.Error:
+                    continue
+            stats["uss_mb"] = round(uss / 1e6, 1)
+        else:
+            try:
+                cdp = await self.context.new_cdp_session(self.page)
+                metrics = {m["name"]: m["value"] for m in (await cdp.send("Performance.getMetrics"))["metrics"]}
+                await cdp.detach()
+                stats["js_heap_mb"] = round(metrics.get("JSHeapTotalSize", 0) / 1e6, 1)
+            except Exception:
+                pass  # not Chromium (no CDP): tab count only
+        BROWSER_TABS.set(stats["tabs"], session=self.name)
+        for source in ("uss", "js_heap"):
+            if stats[f"{source}_mb"] is not None:
+                BROWSER_MEMORY_MB.set(stats[f"{source}_mb"], session=self.name, source=source)
+        return stats
+
+    async def _after_job(self):
+        reason = None
+        if self._since_sample >= self.sample_every:
+            self._since_sample = 0
+            stats = await self.sample()
+            log_event(log, "browser_sample", session=self.name, jobs=self.total_jobs, **stats)
+            memory = stats["uss_mb"] if stats["uss_mb"] is not None else stats["js_heap_mb"]
+            if memory is not None and memory >= self.max_memory_mb:
+                reason = "memory"
+        if reason is None and self.max_jobs and self.jobs >= self.max_jobs:
+            reason = "jobs"
+        if reason:
+            await self.recycle(reason)
+
+    async def recycle(self, reason: str):
+        CONTEXT_RECYCLES.inc(reason=reason, session=self.name)
+        log_event(log, "context_recycled", session=self.name, reason=reason, jobs=self.jobs,
+                  total_jobs=self.total_jobs)
+        self.recycles += 1
+        await self.close()
+        await self.start()
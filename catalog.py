@@ -0,0 +1,126 @@
+# catalog.py
+"""
+Allowed-room catalog for the cleaner, read from room_catalog.json (next to
+august_config_by_city_v2.json) instead of a literal dict in clean_with_openai.py.
+
+    {"hotels": {"jabal omar hyatt regency": {"aliases": ["Jabal Omar Hyatt Regency Makkah"],
+                                             "rooms": ["standard twin room (haram view) - bb", ...]}}}
+
+Room names are canonicalised once at load (lowercase, single spaces) and otherwise
+kept as written: they become normalized_room_type and from there the Firestore
+Rooms/<id> doc ids and rollup keys, so "standard triple room – bb" must stay an en dash
+for the Madinah hotels. Matching is dash-insensitive instead: fold() also maps "–"/"—"
+to "-", so a GPT answer or cached value written with either dash finds the catalog
+spelling.
+
+Hotel names and aliases are folded into one index, so resolving a scraped hotel name
+is a dict lookup. A name that isn't indexed falls back to the old "catalog key
+contained in the scraped name" rule, and that result is memoised too.
+
+Each hotel has a `version` hash of its rooms. The cleaner adds it to its cache keys, so
+editing one hotel's rooms only re-classifies that hotel. current_catalog() re-reads the
+file when its mtime changes, so a long-running process (the API) picks up edits without
+a restart.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from utils.metrics import get_logger, log_event
+
+log = get_logger("catalog")
+
+CATALOG_PATH = Path(__file__).resolve().parent / "room_catalog.json"
+
+def canonical(text: str) -> str:
+    """Stored form: lowercase, single spaces; dashes are left alone."""
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+def fold(text: str) -> str:
+    """Match form: canonical() with en/em dashes folded to "-"."""
+    return canonical((text or "").replace("–", "-").replace("—", "-"))
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+class HotelEntry:
+    __slots__ = ("key", "aliases", "rooms", "version")
+
+    def __init__(self, key: str, aliases: List[str], rooms: List[str]):
+        self.key = fold(key)
+        self.aliases: FrozenSet[str] = frozenset(fold(a) for a in aliases if fold(a)) | {self.key}
+        self.rooms: FrozenSet[str] = frozenset(canonical(r) for r in rooms if canonical(r))
+        self.version = _digest(sorted(self.rooms))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"aliases": sorted(self.aliases), "rooms": sorted(self.rooms), "version": self.version}
+
+class Catalog:
+    def __init__(self, hotels: Dict[str, HotelEntry], path: Optional[Path] = None, mtime: Optional[float] = None):
+        self.hotels = hotels
+        self.path = path
+        self.mtime = mtime
+        self.version = _digest({k: e.version for k, e in hotels.items()})
+        self._index: Dict[str, Optional[HotelEntry]] = {}
+        for entry in hotels.values():
+            for alias in entry.aliases:
+                self._index[alias] = entry
+        # longest alias first, so "al madinah ..." can't shadow a more specific name
+        self._by_length = sorted(self._index.items(), key=lambda kv: len(kv[0]), reverse=True)
+
+    @classmethod
+    def load(cls, path: Path = CATALOG_PATH) -> "Catalog":
+        path = Path(path)
+        mtime = path.stat().st_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        hotels = {}
+        for key, spec in data.get("hotels", {}).items():
+            entry = HotelEntry(key, spec.get("aliases", []), spec.get("rooms", []))
+            hotels[entry.key] = entry
+        return cls(hotels, path, mtime)
+
+    def resolve(self, hotel_name: str) -> Optional[HotelEntry]:
+        name = fold(hotel_name)
+        if name in self._index:
+            return self._index[name]
+        entry = next((e for alias, e in self._by_length if alias in name), None)
+        self._index[name] = entry
+        return entry
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "path": str(self.path) if self.path else None,
+                "hotels": {k: e.as_dict() for k, e in sorted(self.hotels.items())}}
+
+# ============== Hot reload ==============
+_current: Optional[Catalog] = None
+_failed_mtime: Optional[float] = None  # a broken edit is reported once, not on every call
+_lock = threading.Lock()
+
+def current_catalog(path: Path = CATALOG_PATH) -> Catalog:
+    """The loaded catalog, re-read if the file changed since; a broken edit keeps the last good one."""
+    global _current, _failed_mtime
+    path = Path(path)
+    with _lock:
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            if _current is None:
+                raise
+            return _current
+        stale = _current is None or _current.path != path or _current.mtime != mtime
+        if stale and mtime != _failed_mtime:
+            try:
+                _current = Catalog.load(path)
+                log_event(log, "catalog_loaded", path=str(path), version=_current.version,
+                          hotels=len(_current.hotels))
+            except (OSError, ValueError) as e:
+                if _current is None:
+                    raise
+                _failed_mtime = mtime
+                log_event(log, "catalog_reload_failed", logging.ERROR, path=str(path), error=str(e))
+        return _current
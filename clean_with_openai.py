@@ -4,103 +4,25 @@ import os
 import json
 import re
 import asyncio
+import logging
+import time
+from typing import Any, Dict
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from catalog import current_catalog, fold
+from raw_store import ProcessedLog, iter_job_records, write_json_atomic
+from utils.metrics import get_logger, log_event, write_textfile, CLASSIFICATIONS, GPT_SECONDS
 
 # ============== Load environment & OpenAI client ==============
 load_dotenv()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# ============== Allowed room names ==============
-allowed_rooms = {
-    "emaar legend": {
-        "standard twin room - ro",
-        "standard double room - ro",
-        "standard triple room - ro",
-        "standard quad room - ro"
-    },
-    "jabal omar hyatt regency": {
-        "standard quad room - bb",
-        "standard triple room - bb",
-        "standard twin room (haram view) - bb",
-        "standard double room (haram view) - bb",
-        "standard double room (haram view) - ro",
-        "standard twin room (haram view) - ro",
-        "standard quad room - ro",
-        "standard triple room - ro",
-        "standard double room - bb",
-        "standard double room - ro",
-        "standard twin room ro"
-    },
-    "al ebaa hotel": {
-        "standard twin room - ro",
-        "standard double room - ro",
-        "standard triple room - ro",
-        "standard quad room - ro",
-        "standard twin room - bb",
-        "standard double room - bb",
-        "standard triple room - bb",
-        "standard quad room - bb"
-    },
-    "elaf ajyad": {
-        "standard room - ro",
-        "standard double room - ro",
-        "standard triple room - ro",
-        "standard quad room - ro",
-        "standard room - bb",
-        "standard double room - bb",
-        "standard triple room - bb",
-        "standard quad room - bb"
-    },
-    "makarem ajyad makkah hotel": {
-        "standard twin room - ro",
-        "standard double room - ro",
-        "standard triple room - ro",
-        "standard quad room - ro",
-        "standard twin room - bb",
-        "standard double room - bb",
-        "standard triple room - bb",
-        "standard quad room - bb"
-    },
-    "Zaha Al Munawara Hotel": {
-        "standard Twin Room (2 Single Beds) – bb",
-        "standard Triple Room – bb",
-        "standard Quad Room – bb"
-    },
-    "Hafawah Suites": {
-        "Executive Suite (2 Adults) - ro",
-        "Executive Suite (3 Adults) - ro",
-        "Executive Suite (4 Adults) - ro"
-    },
-    "New Madinah Hotel": {
-        "standard Double Room - ro",
-        "standard Double King – ro",
-        "standard Triple Room – ro",
-        "standard Quad Room – ro",
-        "standard Twin Room (2 Single Beds) – bb",
-        "standard Double Room (1 Double Bed) – bb",
-        "standard Triple Room – bb",
-        "standard Quad Room – bb"
-    },
-    "Crowne Plaza Madinah": {
-        "standard Double Room - ro",
-        "standard Double King – ro",
-        "standard Triple Room – ro",
-        "standard Twin Room (2 Single Beds) – bb",
-        "standard Double Room (1 Double Bed) – bb",
-        "standard Triple Room – bb"
-    },
-    "Saja Al Madinah": {
-        "standard Twin Room - ro",
-        "standard Double Room – ro",
-        "standard Triple Room – ro",
-        "standard Quad Room – ro",
-        "standard Twin Room – bb",
-        "standard Double Room – bb",
-        "standard Triple Room – bb",
-        "standard Quad Room – bb"
-    }
-}
+log = get_logger("cleaner")
+client = None  # created by get_client() on the first GPT call
+
+def get_client():
+    global client
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
 
 # ============== Helpers ==============
 def normalize(text: str) -> str:
@@ -125,25 +47,50 @@ MEAL_BB_TOKENS = [
 
 # ============== Cache ==============
 cache_file = "classification_cache.json"
-if os.path.exists(cache_file):
-    with open(cache_file, "r", encoding="utf-8") as f:
-        classification_cache = json.load(f)
-else:
-    classification_cache = {}
+PROCESSED_LOG = ".processed_inputs"  # in the output folder; raw_store.ProcessedLog
+classification_cache = {}
+_cache_loaded = False
+
+def load_cache():
+    """Read the cache file once per process, on first use."""
+    global _cache_loaded
+    if not _cache_loaded:
+        if os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                classification_cache.update(json.load(f))
+        _cache_loaded = True
 
 def save_cache():
+    if not _cache_loaded:
+        return  # nothing was read or classified; don't clobber the file with {}
     with open(cache_file, "w", encoding="utf-8") as f:
         json.dump(classification_cache, f, ensure_ascii=False, indent=2)
 
 # ============== GPT classifier ==============
-async def classify_room(hotel, room_name, meal_plan, allowed_set):
+async def classify_room(hotel, room_name, meal_plan, allowed_set, catalog_version=""):
     """
     Only called for normalized meals 'ro' or 'bb'.
-    Returns one of allowed_set (lowercased) or 'ignore'.
+    Returns one of allowed_set (catalog spellings) or 'ignore'.
+    catalog_version (the hotel's catalog hash) is part of the cache key, so
+    answers given against an older room list are not reused.
     """
-    key = f"{hotel}|||{room_name}|||{meal_plan}"
+    load_cache()
+    key = f"{hotel}|||{room_name}|||{meal_plan}|||{catalog_version}"
+    # pre-versioning entry: migrated once, under the first catalog version that meets it,
+    # then removed, so a later catalog change re-asks like any other versioned answer.
+    # An 'ignore' or a room that is still allowed is carried over; a room that left the
+    # catalog is dropped and GPT asked.
+    legacy = classification_cache.pop(f"{hotel}|||{room_name}|||{meal_plan}", None)
+    if key not in classification_cache and legacy:
+        allowed_by_fold = {fold(opt): opt for opt in allowed_set}
+        if legacy == "ignore":
+            classification_cache[key] = legacy
+        elif fold(legacy) in allowed_by_fold:
+            classification_cache[key] = allowed_by_fold[fold(legacy)]
     if key in classification_cache:
-        print(f"🧠 Using cached result → {classification_cache[key]}")
+        CLASSIFICATIONS.inc(source="cached")
+        log_event(log, "classified", source="cached", room=room_name, meal=meal_plan,
+                  result=classification_cache[key])
         return classification_cache[key]
 
     prompt = f"""
@@ -161,12 +108,12 @@ Your task:
 7. If two names have the same meaning, pick the closest allowed name.
 
 Allowed room names:
-{chr(10).join(f"- {opt}" for opt in allowed_set)}
+{chr(10).join(f"- {opt}" for opt in sorted(allowed_set))}
 """.strip()
 
     try:
-        print(f"🔎 GPT: Room='{room_name}', Meal='{meal_plan}'")
-        response = await client.chat.completions.create(
+        started = time.perf_counter()
+        response = await get_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a strict hotel room classifier. Match to the most similar allowed room. Only return the exact allowed room name or 'ignore'."},
@@ -175,59 +122,154 @@ Allowed room names:
             temperature=0,
             max_tokens=50
         )
+        GPT_SECONDS.observe(time.perf_counter() - started)
         raw = (response.choices[0].message.content or "").strip().lower()
         cleaned = None
 
-        # Exact or contains match against allowed_set
-        for option in allowed_set:
-            opt_low = option.lower()
-            if opt_low == raw or opt_low in raw:
-                cleaned = opt_low
+        # Exact or contains match against allowed_set, whichever dash GPT used
+        for option in sorted(allowed_set):
+            if fold(option) == fold(raw) or fold(option) in fold(raw):
+                cleaned = option
                 break
 
         if not cleaned and "ignore" in raw:
             cleaned = "ignore"
         if not cleaned:
-            print(f"⚠️ Unexpected GPT output → {raw}")
+            log_event(log, "gpt_unexpected_output", logging.WARNING, room=room_name, output=raw)
             cleaned = "ignore"
 
-        print(f"✅ GPT classified as → {cleaned}")
+        CLASSIFICATIONS.inc(source="gpt")
+        log_event(log, "classified", source="gpt", room=room_name, meal=meal_plan, result=cleaned,
+                  seconds=round(time.perf_counter() - started, 3))
         classification_cache[key] = cleaned
         return cleaned
     except Exception as e:
-        print("❌ OpenAI API error:", e)
+        CLASSIFICATIONS.inc(source="gpt_error")
+        log_event(log, "gpt_error", logging.ERROR, room=room_name, error=str(e))
         return "ignore"
 
-# ============== Main cleaner ==============
-async def clean_with_gpt():
-    input_folder = "hotel_data"
-    output_folder = "cleaned_data"
-    os.makedirs(output_folder, exist_ok=True)
+# ============== Sweep dedup ==============
+# Concurrent GPT requests while classifying the unique keys of a sweep
+CLASSIFY_CONCURRENCY = int(os.getenv("CLASSIFY_CONCURRENCY", "4"))
 
-    for filename in sorted(os.listdir(input_folder)):
-        if not filename.endswith(".json"):
+def rule_verdict(hotel_key_norm: str, raw_room: str, raw_meal: str):
+    """
+    What the rules do with one (room, meal) pair, as (action, value):
+      skip_empty | discard_room | discard_meal | flag      → value None
+      candidate                                            → twin_or_double / king / queen
+      classify                                             → normalized meal 'ro' / 'bb'
+    Depends only on its arguments, so a sweep evaluates it once per unique pair.
+    """
+    if not raw_room or raw_room in ["n/a"]:
+        return "skip_empty", None
+
+    # ---------- Discard by RAW room tokens ----------
+    if hotel_key_norm != "hafawah suites" and any(tok in raw_room for tok in ROOM_SKIP_TOKENS):
+        return "discard_room", None
+
+    # ---------- Detect candidates (do not classify now) ----------
+    # twin or double (with slash or the word 'or')
+    if re.search(r"\b(twin|twn)\s*(/|or)\s*(double|dbl)\b", raw_room) or \
+       re.search(r"\b(double|dbl)\s*(/|or)\s*(twin|twn)\b", raw_room):
+        return "candidate", "twin_or_double"
+    if re.search(r"\bking\b", raw_room):
+        return "candidate", "king"
+    if re.search(r"\bqueen\b", raw_room):
+        return "candidate", "queen"
+
+    # ---------- Meal rejection ----------
+    if any(tok in raw_meal for tok in MEAL_REJECT_TOKENS):
+        return "discard_meal", None
+
+    # Remove noise like 'free wifi' but keep meaning
+    meal_clean = norm_spaces(raw_meal.replace("free wifi", ""))
+
+    # ---------- Meal normalization ----------
+    if any(tok in meal_clean for tok in MEAL_RO_TOKENS):
+        return "classify", "ro"
+    if any(tok in meal_clean for tok in MEAL_BB_TOKENS):
+        return "classify", "bb"
+    return "flag", None
+
+def build_sweep_index(input_folder: str, catalog, only=None) -> Dict[tuple, Dict[str, Any]]:
+    """
+    One streamed pass over the sweep collapsing rows to unique (hotel, room, meal) keys,
+    where hotel is the scraped hotel name and room/meal are the normalize()d strings the
+    rules see. Each key keeps its rule verdict and its row count; only this index is held
+    between the passes, never the rows. Files whose hotel is not in the catalog are left out.
+    """
+    index: Dict[tuple, Dict[str, Any]] = {}
+    for _filename, records in iter_job_records(input_folder, only):
+        if not records:
+            continue
+        hotel_raw = normalize(records[0].get("H", ""))
+        entry = catalog.resolve(hotel_raw)
+        if entry is None:
             continue
+        for record in records:
+            key = (hotel_raw, normalize(record.get("R", "")), normalize(record.get("M", "")))
+            item = index.get(key)
+            if item is None:
+                item = index[key] = {"entry": entry, "verdict": rule_verdict(entry.key, key[1], key[2]),
+                                     "rows": 0}
+            item["rows"] += 1
+    return index
+
+async def classify_sweep(sweep: Dict[tuple, Dict[str, Any]]) -> Dict[tuple, str]:
+    """classify_room once per unique (hotel, room, normalized meal), a few requests at a time."""
+    todo = {}
+    for (hotel_raw, raw_room, _raw_meal), item in sweep.items():
+        action, meal = item["verdict"]
+        if action == "classify":
+            todo.setdefault((hotel_raw, raw_room, meal), item["entry"])
+
+    results: Dict[tuple, str] = {}
+    gate = asyncio.Semaphore(max(1, CLASSIFY_CONCURRENCY))
+
+    async def _one(key, entry):
+        async with gate:
+            results[key] = await classify_room(*key, entry.rooms, entry.version)
+
+    await asyncio.gather(*(_one(key, entry) for key, entry in todo.items()))
+    return results
 
-        filepath = os.path.join(input_folder, filename)
-        with open(filepath, "r", encoding="utf-8") as f:
-            records = json.load(f)
+# ============== Main cleaner ==============
+async def clean_with_gpt(input_folder: str = "hotel_data", output_folder: str = "cleaned_data",
+                         reprocess: bool = False):
+    """
+    Clean the raw files and segments that are new or have grown since the last run
+    (tracked in <output_folder>/.processed_inputs; a catalog change or reprocess=True
+    re-reads everything). One cleaned_data/<Hotel>_<checkin>_to_<checkout>.json per job.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    load_cache()
+    catalog = current_catalog()
+    processed = ProcessedLog(os.path.join(output_folder, PROCESSED_LOG), catalog.version, reset=reprocess)
+    pending = processed.pending(input_folder)
+    if not pending:
+        log_event(log, "nothing_to_clean", folder=input_folder)
+        return
+
+    # pass 1: unique keys across the whole sweep, each classified once
+    sweep = build_sweep_index(input_folder, catalog, only=pending)
+    classified = await classify_sweep(sweep)
+    rows = sum(item["rows"] for item in sweep.values())
+    log_event(log, "sweep_deduplicated", rows=rows, unique_keys=len(sweep), classify_keys=len(classified))
+
+    # pass 2: legacy <Hotel>_<date>.json files and raw segments, one job at a time
+    for filename, records in iter_job_records(input_folder, only=pending):
         if not records:
             continue
 
-        # Identify hotel by fuzzy key containment
+        # Identify hotel via the catalog's alias index
         hotel_raw = normalize(records[0].get("H", ""))
-        matched_key = None
-        for known in allowed_rooms:
-            if normalize(known) in hotel_raw:
-                matched_key = known
-                break
-
-        if not matched_key:
-            print(f"⏭️ Skipping: '{hotel_raw}' — no match in allowed list")
+        entry = catalog.resolve(hotel_raw)
+        if entry is None:
+            log_event(log, "hotel_not_in_allowed_list", logging.WARNING, hotel=hotel_raw, file=filename)
             continue
 
-        allowed_set = allowed_rooms[matched_key]
-        allowed_lower = {x.lower() for x in allowed_set}
+        matched_key = entry.key
+        allowed_set = entry.rooms  # already canonical (lowercase, catalog dashes)
 
         cleaned = []
         accepted_room_types = set()  # final accepted in this file
@@ -236,88 +278,48 @@ async def clean_with_gpt():
         # candidate_type in {"twin_or_double", "king", "queen"}
         candidates = []
 
-        print(f"\n🔍 Cleaning: {filename} ({len(records)} records) — Hotel key: {matched_key}")
+        log_event(log, "cleaning_file", file=filename, records=len(records), hotel_key=matched_key,
+                  catalog_version=entry.version)
 
         for record in records:
             raw_room = normalize(record.get("R", ""))
             raw_meal = normalize(record.get("M", ""))
-
-            if not raw_room or raw_room in ["n/a"]:
-                print(f"⏭️ Skipping empty or N/A room → {record}")
-                continue
-
-            if not matched_key:
-                print(f"⏭️ Skipping: '{hotel_raw}' — no match in allowed list")
-                continue
-
-            allowed_set = allowed_rooms[matched_key]
-            allowed_lower = {x.lower() for x in allowed_set}
-
-            # ✅ Add this line so hotel_key_norm exists
-            hotel_key_norm = normalize(matched_key)
-
-            # ---------- Discard by RAW room tokens ----------
-            if hotel_key_norm != "hafawah suites" and any(tok in raw_room for tok in ROOM_SKIP_TOKENS):
-                print(f"⏭️ Discard by room token ({ROOM_SKIP_TOKENS}) → {raw_room}")
-                continue
-
-            # ---------- Detect candidates (do not classify now) ----------
-            # twin or double (with slash or the word 'or')
-            if re.search(r"\b(twin|twn)\s*(/|or)\s*(double|dbl)\b", raw_room) or \
-               re.search(r"\b(double|dbl)\s*(/|or)\s*(twin|twn)\b", raw_room):
-                candidates.append((record, None, "twin_or_double"))
-                print(f"🗂️ Stashed candidate (twin_or_double) → {raw_room}")
-                continue
-
-            if re.search(r"\bking\b", raw_room):
-                candidates.append((record, None, "king"))
-                print(f"🗂️ Stashed candidate (king) → {raw_room}")
-                continue
-
-            if re.search(r"\bqueen\b", raw_room):
-                candidates.append((record, None, "queen"))
-                print(f"🗂️ Stashed candidate (queen) → {raw_room}")
-                continue
-
-            # ---------- Meal rejection ----------
-            if any(tok in raw_meal for tok in MEAL_REJECT_TOKENS):
-                print(f"⏭️ Discard by meal token ({MEAL_REJECT_TOKENS}) → {raw_meal}")
-                continue
-
-            # Remove noise like 'free wifi' but keep meaning
-            meal_clean = norm_spaces(raw_meal.replace("free wifi", ""))
-
-            # ---------- Meal normalization ----------
-            normalized_meal = None
-            if any(tok in meal_clean for tok in MEAL_RO_TOKENS):
-                normalized_meal = "ro"
-            elif any(tok in meal_clean for tok in MEAL_BB_TOKENS):
-                normalized_meal = "bb"
-            else:
-                # Unknown → FLAG and do not classify
+            item = sweep.get((hotel_raw, raw_room, raw_meal))  # None only if the file grew since pass 1
+            action, value = item["verdict"] if item else rule_verdict(entry.key, raw_room, raw_meal)
+
+            if action == "skip_empty":
+                log_event(log, "skip_empty_room", record=record)
+            elif action == "discard_room":
+                CLASSIFICATIONS.inc(source="discarded")
+                log_event(log, "discard_room_token", room=raw_room)
+            elif action == "candidate":
+                candidates.append((record, None, value))
+                log_event(log, "stash_candidate", kind=value, room=raw_room)
+            elif action == "discard_meal":
+                CLASSIFICATIONS.inc(source="discarded")
+                log_event(log, "discard_meal_token", meal=raw_meal)
+            elif action == "flag":
+                # Unknown → FLAG and do not classify, but keep the raw record in output for visibility
                 record["flagged_meal"] = raw_meal
                 record["normalized_meal"] = f"FLAG:{raw_meal}"
-                print(f"🚩 Flagging meal (unrecognized) → {raw_meal}")
-                # Keep the raw record in output for visibility (optional: comment next two lines to exclude)
-                # cleaned.append(record)
-                # continue
-                # Safer per your instruction: keep but DO NOT classify
-                cleaned.append(record)
-                continue
-
-            # ---------- Classify with GPT (only RO/BB) ----------
-            classification = await classify_room(hotel_raw, raw_room, normalized_meal, allowed_set)
-            if classification != "ignore":
-                record["normalized_room_type"] = classification
-                record["normalized_meal"] = normalized_meal
+                CLASSIFICATIONS.inc(source="flagged")
+                log_event(log, "flag_meal", logging.WARNING, meal=raw_meal)
                 cleaned.append(record)
-                accepted_room_types.add(classification)
+            else:
+                # ---------- Classified once per unique key (see classify_sweep) ----------
+                classification = classified.get((hotel_raw, raw_room, value)) or \
+                    await classify_room(hotel_raw, raw_room, value, allowed_set, entry.version)
+                if classification != "ignore":
+                    record["normalized_room_type"] = classification
+                    record["normalized_meal"] = value
+                    cleaned.append(record)
+                    accepted_room_types.add(classification)
 
         # ---------- Post-pass: fill missing twin/double using candidates ----------
         # For both meals that appear in allowed_set, if missing, try to promote a candidate
         def need_and_allowed(kind: str, meal: str) -> bool:
-            key = f"standard {kind} room - {meal}".lower()
-            return key in allowed_lower and key not in accepted_room_types
+            key = f"standard {kind} room - {meal}"
+            return key in allowed_set and key not in accepted_room_types
 
         # For each meal type we care about:
         for meal in ("ro", "bb"):
@@ -352,7 +354,8 @@ async def clean_with_gpt():
                     synth["normalized_room_type"] = f"standard twin room - {meal}"
                     cleaned.append(synth)
                     accepted_room_types.add(synth["normalized_room_type"])
-                    print(f"➕ Filled missing TWIN ({meal}) from candidate.")
+                    CLASSIFICATIONS.inc(source="local")
+                    log_event(log, "filled_from_candidate", kind="twin", meal=meal)
             # double missing?
             if need_and_allowed("double", meal):
                 picked = None
@@ -385,22 +388,30 @@ async def clean_with_gpt():
                     synth["normalized_room_type"] = f"standard double room - {meal}"
                     cleaned.append(synth)
                     accepted_room_types.add(synth["normalized_room_type"])
-                    print(f"➕ Filled missing DOUBLE ({meal}) from candidate ({preference}).")
+                    CLASSIFICATIONS.inc(source="local")
+                    log_event(log, "filled_from_candidate", kind="double", meal=meal, preference=preference)
 
         # ====== Save cleaned file ======
         if cleaned:
             output_path = os.path.join(output_folder, filename)
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(cleaned, f, ensure_ascii=False, indent=2)
-            print(f"✅ Saved cleaned file → {output_path} ({len(cleaned)} entries)")
+            write_json_atomic(output_path, cleaned)  # main.py never sees a half-written file
+            log_event(log, "cleaned_file_saved", file=output_path, entries=len(cleaned))
         else:
-            print(f"⚠️ No matching rooms found in {filename}")
+            log_event(log, "no_matching_rooms", logging.WARNING, file=filename)
 
+    processed.mark(pending)
+    processed.save()
     save_cache()
 
 # ============== Entrypoint ==============
 if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Classify scraped rooms into cleaned_data/.")
+    ap.add_argument("--all", action="store_true", help="Re-clean every input, not just new or grown ones")
+    args = ap.parse_args()
     try:
-        asyncio.run(clean_with_gpt())
+        asyncio.run(clean_with_gpt(reprocess=args.all))
     finally:
         save_cache()
+        write_textfile("cleaner")  # picked up by main.py's metrics server and the API's /metrics
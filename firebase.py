@@ -1,15 +1,28 @@
 # firebase_setup.py
 from pathlib import Path
-import firebase_admin
-from firebase_admin import credentials, firestore
 
 BASE_DIR = Path(__file__).resolve().parent
 KEY_PATH = BASE_DIR / "serviceAccountKey.json"
 
-if not KEY_PATH.exists():
-    raise FileNotFoundError(f"Firebase key not found at: {KEY_PATH}")
+_db = None
 
-cred = credentials.Certificate(str(KEY_PATH))
-firebase_admin.initialize_app(cred)
+def get_db():
+    """Firestore client, created on first use so importing this module is free."""
+    global _db
+    if _db is None:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
 
-db = firestore.client()
+        if not KEY_PATH.exists():
+            raise FileNotFoundError(f"Firebase key not found at: {KEY_PATH}")
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(str(KEY_PATH)))
+        _db = firestore.client()
+    return _db
+
+def __getattr__(name):
+    # keeps `from firebase import db` working for the maintenance scripts
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
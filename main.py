@@ -1,22 +1,36 @@
 # main.py
 
 import asyncio
+import hmac
+import logging
 import os
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
-from playwright.async_api import async_playwright
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 import subprocess
-from save_nested import save_cleaned_rows_nested
-from fastapi import FastAPI
-from pydantic import BaseModel
+import sys
+from save_nested import _as_date, load_month_history, save_cleaned_rows_nested
+from work_queue import WorkQueue
+from browser_session import BrowserSession
+from catalog import current_catalog
+from price_feed import PRICE_FEED_TOKEN, forward_rows, hub as price_hub
+from resilience import (CircuitBreaker, JobFailed, SignInRequired, classify_error, retry_step, FINAL_OUTCOMES,
+                        INVALID_DATES, NO_AVAILABILITY, NOT_FOUND, OK, SESSION_EXPIRED)
+from raw_store import SegmentWriter, iter_job_records, is_segment
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, field_validator
 from fastapi.middleware.cors import CORSMiddleware
+from utils.metrics import (get_logger, log_event, render_prometheus, start_metrics_server, write_textfile,
+                           METRICS_DIR, METRICS_PORT, SCRAPE_STEP_SECONDS, SCRAPE_JOBS, ROWS_EXTRACTED)
 
 
 # Load environment variables
 load_dotenv()
+log = get_logger("scraper")
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -29,16 +43,144 @@ AGENT_ID = os.getenv("AGENT_ID")
 AGENT_NAME = os.getenv("AGENT_NAME")
 PASSWORD = os.getenv("PASSWORD")
 CHROME_PROFILE_PATH = os.getenv("CHROME_PROFILE_PATH")
+# point at simulator/site.py for local load tests
+MYHOTELS_BASE_URL = os.getenv("MYHOTELS_BASE_URL", "https://business.myhotels.sa").rstrip("/")
 
 PROJECT_DIR = Path(__file__).resolve().parent
 CLEAN_DIR = PROJECT_DIR / "cleaned_data"
 RAW_DIR = PROJECT_DIR / "hotel_data"
 SCREEN_DIR = PROJECT_DIR / "screenshots"
+WORKERS_DIR = RAW_DIR / ".workers"  # per-worker outputs in sharded mode
+QUARANTINE_DIR = PROJECT_DIR / "quarantine"  # prices held back by screen_rows
+
+def async_playwright():
+    # Playwright is only needed by the scraper, not by the API process; import it on first use
+    from playwright.async_api import async_playwright as _async_playwright
+    return _async_playwright()
 
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI!"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # the API's own metrics plus textfiles from pipeline processes on this host (see utils.metrics)
+    return PlainTextResponse(render_prometheus(METRICS_DIR), media_type="text/plain; version=0.0.4")
+
+@app.get("/catalog")
+def catalog():
+    # re-read when room_catalog.json changes, so edits show up without a restart
+    return current_catalog().as_dict()
+
+@app.websocket("/ws/prices")
+async def ws_prices(websocket: WebSocket, city: Optional[str] = None, hotel: Optional[str] = None,
+                    date_from: Optional[str] = None, date_to: Optional[str] = None):
+    """Push price changes as JSON messages, filtered by city, hotel and/or date range (YYYY-MM-DD)."""
+    await websocket.accept()
+    try:
+        sub = price_hub.subscribe(city=city, hotel=hotel, date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+        return
+
+    async def pump():
+        while True:
+            event = await sub.get()
+            await websocket.send_json({"type": "price", "dropped": sub.dropped, **event})
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            await websocket.receive_text()  # nothing to read; this is how a disconnect shows up
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        sub.close()
+
+class PriceRow(BaseModel):
+    # the fields PriceHub.changes() reads; a bad row is a 422 for the whole batch
+    city: str
+    hotel: str
+    date: str
+    room_name: str
+    meal_plan: Optional[str] = ""
+    price: Optional[float] = None
+    currency: str = "SAR"
+    scraped_at: Optional[str] = None
+
+    @field_validator("city", "hotel", "room_name")
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("must not be blank")
+        return value
+
+    @field_validator("date")
+    @classmethod
+    def known_date(cls, value: str) -> str:
+        _as_date(value)  # ValueError for anything save_nested can't store
+        return value
+
+class PriceIngest(BaseModel):
+    rows: List[PriceRow]
+
+@app.post("/prices/ingest")
+def prices_ingest(data: PriceIngest, x_price_feed_token: str = Header("")):
+    # a pipeline in another process (python main.py) forwards its saved rows here;
+    # without a shared token anyone who can reach the API could push fake prices
+    if not PRICE_FEED_TOKEN:
+        raise HTTPException(status_code=503, detail="price feed ingest is disabled (PRICE_FEED_TOKEN not set)")
+    if not hmac.compare_digest(x_price_feed_token.encode("utf-8"), PRICE_FEED_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="bad price feed token")
+    return {"events": price_hub.publish([row.model_dump() for row in data.rows])}
+
+class LoginRequest(BaseModel):
+    agentId: str
+    username: str
+    password: str
+    otp: str = ""  # Optional by default
+
+@app.post("/login")
+async def login(data: LoginRequest):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+        page = await context.new_page()
+
+        await page.goto(f"{MYHOTELS_BASE_URL}/")
+
+        # Fill login fields
+        await page.fill("#AgencyCode", data.agentId)
+        await page.fill("#UserName", data.username)
+        await page.fill("#Password", data.password)
+        await page.click("#LoginButton")
+
+        # Check if OTP is requested
+        try:
+            otp_input = await page.wait_for_selector("#OtpCode", timeout=3000)
+            if data.otp == "":
+                await browser.close()
+                return {
+                    "requiresOtp": True,
+                    "message": "OTP required. Please enter it."
+                }
+
+            await otp_input.fill(data.otp)
+            await page.click("#OtpSubmit")
+
+        except:
+            # No OTP requested, continue
+            pass
+
+        # After OTP, check if redirected to dashboard
+        if "dashboard" in page.url.lower():
+            await browser.close()
+            return {"success": True, "message": "Login successful."}
+        else:
+            await browser.close()
+            return {"success": False, "message": "Login failed. Check credentials or OTP."}
+
 def load_config():
     with open("august_config_by_city_v2.json", "r", encoding='utf-8') as f:
         return json.load(f)
@@ -60,246 +202,32 @@ def price_to_float(price_text: str):
     except ValueError:
         return None
 
-async def search_city_hotel(page, context, city, hotel_name, checkin, checkout):
-    if not (validate_date(checkin) and validate_date(checkout)):
-        print(f"❌ Invalid date format for {checkin} - {checkout}")
-        return
-
-    await page.goto("https://business.myhotels.sa/HotelSearch", timeout=30000)
-    await page.wait_for_selector("#txtCityName", timeout=15000)
-
-    await page.click('#txtCityName')
-    await page.fill('#txtCityName', "")
-    for char in city:
-        await page.type('#txtCityName', char, delay=50)
-
-    await page.wait_for_selector(f"div.autocomplete-suggestion:has-text('{city.lower()}')", timeout=15000)
-    suggestions = page.locator("div.autocomplete-suggestion")
-    for i in range(await suggestions.count()):
-        suggestion_el = suggestions.nth(i)
-        text = await suggestion_el.inner_text()
-        if f"{city.lower()}, saudi arabia" in text.lower():
-            await suggestion_el.click(timeout=5000)
-            break
-
-    await page.wait_for_timeout(1500)
-    await page.evaluate("document.getElementById('txtCheckinDate').removeAttribute('readonly')")
-    await page.evaluate("document.getElementById('txtCheckoutDate').removeAttribute('readonly')")
-
-    await page.fill('#txtCheckinDate', "")
-    await page.fill('#txtCheckoutDate', "")
-    await page.wait_for_timeout(300)
-
-    await page.fill('#txtCheckinDate', checkin.strip())
-    await page.fill('#txtCheckoutDate', checkout.strip())
-
-    await page.click('#btnHotelSearch')
-    await page.wait_for_timeout(8000)
-
-    await page.fill('#hotelsearchtext', "")
-    await page.wait_for_timeout(300)
-    for char in hotel_name:
-        await page.type('#hotelsearchtext', char, delay=50)
-    await page.keyboard.press('Enter')
-    await page.wait_for_timeout(3000)
-
-    hotel_titles = page.locator("span.p_name_title")
-    found = False
-    for i in range(await hotel_titles.count()):
-        title_text = (await hotel_titles.nth(i).inner_text()).strip().lower()
-        if hotel_name.strip().lower() in title_text:
-            await hotel_titles.nth(i).click()
-            found = True
-            break
-
-    if not found:
-        print(f"❌ Hotel '{hotel_name}' not found in search results for {city}")
-        return
-
-    await page.wait_for_timeout(3000)
-
-    pages = context.pages
-    if len(pages) < 2:
-        print(f"❌ Hotel details tab did not open for {hotel_name}")
-        return
-
-    hotel_page = pages[-1]
-    await hotel_page.bring_to_front()
-    await hotel_page.wait_for_load_state('load')
-
-    safe_hotel = hotel_name.replace(" ", "_")
-    safe_date = checkin.replace("/", "-")
-    SCREEN_DIR.mkdir(exist_ok=True)
-    await hotel_page.screenshot(path=str(SCREEN_DIR / f"{safe_hotel}_{safe_date}.png"), full_page=True)
-
-    table_exists = False
-    for _ in range(40):
-        count = await hotel_page.evaluate("""
-            () => {
-                const table = document.querySelector("tbody.mobile_class");
-                if (!table) return 0;
-                return table.querySelectorAll("tr.color_no").length;
-            }
-        """)
-        if count > 0:
-            table_exists = True
-            break
-        await hotel_page.wait_for_timeout(1000)
-
-    if not table_exists:
-        print(f"⚠️ Table not found or empty for {hotel_name} in {city} on {checkin}")
-        await hotel_page.close()
-        return
-
-    rows = hotel_page.locator("tbody.mobile_class tr.color_no")
-    extracted = []
-
-    for i in range(await rows.count()):
-        row = rows.nth(i)
-
-        # Room Name
-        try:
-            room_name_el = row.locator(".room_name")
-            if await room_name_el.count() > 0:
-                room_name = await room_name_el.inner_text()
-            elif extracted:
-                room_name = extracted[-1]["R"]
-            else:
-                room_name = "N/A"
-        except:
-            room_name = "N/A"
-
-        if room_name == "N/A":
-            print("⚠️ Skipping row with missing room name")
+def build_hotel_to_city_map(cfg: Dict[str, Any]) -> Dict[str, str]:
+    m = {}
+    for c, hotels in cfg.items():
+        if c == "dates":
             continue
-
-        # Meal Plan
-        try:
-            meal_plan = await row.locator(".icon_with_text > span:last-child").inner_text()
-        except:
-            meal_plan = "N/A"
-
-        # Price
-        try:
-            price = await row.locator("a.total_price .currencytext").first.inner_text()
-        except:
-            price = "N/A"
-
-        extracted.append({
-            "H": hotel_name.strip(),
-            "C": city.strip(),
-            "D": checkin.strip(),
-            "R": room_name.strip(),
-            "M": meal_plan.strip(),
-            "P": price.strip()
-        })
-
-    RAW_DIR.mkdir(exist_ok=True)
-    safe_filename = f"{safe_hotel}_{safe_date}.json"
-    with open(RAW_DIR / safe_filename, "w", encoding="utf-8") as f:
-        json.dump(extracted, f, ensure_ascii=False, indent=2)
-
-    print(f"✅ Extracted {len(extracted)} rows for {hotel_name} in {city} ({checkin} - {checkout})")
-    print(f"💾 Saved to hotel_data/{safe_filename}")
-    await hotel_page.close()
-
-
-async def run():
-    config = load_config()
-    MAX_RETRIES = 2
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch_persistent_context(
-            CHROME_PROFILE_PATH,
-            headless=False,
-            channel="chrome",
-            args=["--disable-popup-blocking", "--disable-notifications"]
-        )
-        context = browser
-        page = await browser.new_page()
-        await page.goto("https://business.myhotels.sa/")
-        await page.wait_for_timeout(5000)
-
-        # Login
-        if await page.is_visible("#txtSignInAgentcode"):
-            await page.fill('#txtSignInAgentcode', AGENT_ID)
-            await page.fill('#txtSignInUsername', AGENT_NAME)
-            await page.fill('#txtSignInPassword', PASSWORD)
-            await page.check('#chkRememberMe')
-            await page.click('#btnLogin')
-
-        # OTP (if needed)
-        try:
-            await page.wait_for_selector('#txtOtpId', timeout=10000)
-            print("🔐 OTP required. Please check your email or phone.")
-            otp = input("🔑 Enter OTP here: ")
-            await page.fill('#txtOtpId', otp)
-            await page.click('#btnLogin1')
-            await page.wait_for_timeout(5000)
-        except:
-            print("✅ No OTP requested, continuing login.")
-
-        # Iterate config
-        for city, hotels in config.items():
-            if city == "dates":
-                continue
-            for hotel in hotels:
-                for checkin, checkout in config["dates"]:
-                    for attempt in range(MAX_RETRIES):
-                        try:
-                            print(f"🔍 Searching {hotel} in {city} from {checkin} to {checkout}")
-                            await search_city_hotel(page, context, city, hotel, checkin, checkout)
-                            break
-                        except Exception as e:
-                            print(f"❌ Attempt {attempt+1} failed: {e}")
-                            if attempt == MAX_RETRIES - 1:
-                                print("⚠️ Skipping after multiple failures.")
-
-        await browser.close()
-
-    # Run cleaning script (unchanged)
-    print("\n⚙️ Running cleaner...")
-    import sys
-    CLEAN_DIR.mkdir(exist_ok=True)
-    result = subprocess.run([sys.executable, "clean_with_openai.py"])
-    if result.returncode != 0:
-        print("❌ Cleaner failed. Aborting Firestore save.")
-        return
-
-    # -------- NEW: Load ALL cleaned files, parse hotel/date from filename, map city, then save --------
-
-    def build_hotel_to_city_map(cfg: Dict[str, Any]) -> Dict[str, str]:
-        m = {}
-        for c, hotels in cfg.items():
-            if c == "dates":
-                continue
-            for h in hotels:
-                m[h.strip().lower()] = c
-        return m
-
-    def parse_hotel_date_from_filename(p: Path):
-        # Zaha_Al_Munawara_Hotel_31-08-2025.json -> ("Zaha Al Munawara Hotel", "31-08-2025")
-        stem = p.stem
-        if "_" in stem:
-            *name_parts, date_part = stem.split("_")
-            hotel_from_file = " ".join(name_parts).replace("-", " ").strip()
-            return hotel_from_file, date_part
-        return stem.replace("_", " ").strip(), None
-
-    hotel_to_city = build_hotel_to_city_map(config)
-    files = sorted(CLEAN_DIR.glob("*.json"))
-    if not files:
-        print("❌ No cleaned JSON files found in cleaned_data/")
-        return
-
+        for h in hotels:
+            m[h.strip().lower()] = c
+    return m
+
+def parse_hotel_date_from_filename(p: Path):
+    # Zaha_Al_Munawara_Hotel_31-08-2025.json -> ("Zaha Al Munawara Hotel", "31-08-2025")
+    # Zaha_Al_Munawara_Hotel_31-08-2025_to_02-09-2025.json -> same (raw_store.job_filename)
+    stem = p.stem
+    if "_to_" in stem:
+        stem = stem.rsplit("_to_", 1)[0]
+    if "_" in stem:
+        *name_parts, date_part = stem.split("_")
+        hotel_from_file = " ".join(name_parts).replace("-", " ").strip()
+        return hotel_from_file, date_part
+    return stem.replace("_", " ").strip(), None
+
+def normalize_cleaned_files(clean_dir: Path, hotel_to_city: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Turn cleaned_data/ rows (JSON files or segments) into the payload save_cleaned_rows_nested expects."""
     normalized: List[Dict[str, Any]] = []
-    for fp in files:
-        hotel_from_file, date_from_file = parse_hotel_date_from_filename(fp)
-        try:
-            rows = json.loads(fp.read_text(encoding="utf-8"))
-        except Exception as e:
-            print(f"⚠️ Skipping {fp.name}: {e}")
-            continue
+    for name, rows in iter_job_records(clean_dir):
+        hotel_from_file, date_from_file = parse_hotel_date_from_filename(Path(name))
 
         for r in rows:
             # accept many possible keys from cleaner
@@ -333,59 +261,672 @@ async def run():
                 "source": r.get("source", "myhotels.sa"),
                 "scraped_at": r.get("scraped_at"),
             })
+    return normalized
 
-            class LoginRequest(BaseModel):
-                agentId: str
-                username: str
-                password: str
-                otp: str = ""  # Optional by default
+_raw_writers: Dict[Path, SegmentWriter] = {}
 
-            @app.post("/login")
-            async def login(data: LoginRequest):
-                async with async_playwright() as p:
-                    browser = await p.chromium.launch(headless=True)
-                    context = await browser.new_context()
-                    page = await context.new_page()
+def raw_writer(directory: Path) -> SegmentWriter:
+    """One segment writer per output folder for the life of the process."""
+    if directory not in _raw_writers:
+        _raw_writers[directory] = SegmentWriter(directory, prefix="raw")
+    return _raw_writers[directory]
+
+async def open_hotel_details(page, context, city, hotel_name, checkin, checkout):
+    """Search steps up to the hotel's details tab; None when the hotel isn't in the results."""
+    job = {"city": city, "hotel": hotel_name, "checkin": checkin, "checkout": checkout}
+
+    async def open_search():
+        response = await page.goto(f"{MYHOTELS_BASE_URL}/HotelSearch", timeout=30000)
+        if response is not None and response.status >= 500:
+            raise RuntimeError(f"HTTP {response.status} from /HotelSearch")
+        if await page.is_visible("#txtSignInAgentcode"):
+            raise JobFailed(SESSION_EXPIRED, "open_search", "redirected to the sign-in form")
+        await page.wait_for_selector("#txtCityName", timeout=15000)
+
+    async def select_city():
+        await page.click('#txtCityName')
+        await page.fill('#txtCityName', "")
+        for char in city:
+            await page.type('#txtCityName', char, delay=50)
+
+        await page.wait_for_selector(f"div.autocomplete-suggestion:has-text('{city.lower()}')", timeout=15000)
+        suggestions = page.locator("div.autocomplete-suggestion")
+        for i in range(await suggestions.count()):
+            suggestion_el = suggestions.nth(i)
+            text = await suggestion_el.inner_text()
+            if f"{city.lower()}, saudi arabia" in text.lower():
+                await suggestion_el.click(timeout=5000)
+                break
+
+        await page.wait_for_timeout(1500)
+
+    async def set_dates():
+        await page.evaluate("document.getElementById('txtCheckinDate').removeAttribute('readonly')")
+        await page.evaluate("document.getElementById('txtCheckoutDate').removeAttribute('readonly')")
+
+        await page.fill('#txtCheckinDate', "")
+        await page.fill('#txtCheckoutDate', "")
+        await page.wait_for_timeout(300)
+
+        await page.fill('#txtCheckinDate', checkin.strip())
+        await page.fill('#txtCheckoutDate', checkout.strip())
+
+    async def search():
+        await page.click('#btnHotelSearch')
+        await page.wait_for_timeout(8000)
+
+    async def filter_hotel():
+        await page.fill('#hotelsearchtext', "")
+        await page.wait_for_timeout(300)
+        for char in hotel_name:
+            await page.type('#hotelsearchtext', char, delay=50)
+        await page.keyboard.press('Enter')
+        await page.wait_for_timeout(3000)
+
+        hotel_titles = page.locator("span.p_name_title:visible")
+        count = await hotel_titles.count()
+        for i in range(count):
+            title_text = (await hotel_titles.nth(i).inner_text()).strip().lower()
+            if hotel_name.strip().lower() in title_text:
+                return hotel_titles.nth(i)
+        # The filter box belongs to the results view, so a list that rendered without our
+        # hotel, or rendered empty, is an answer: not_found, not retried. Only when the
+        # results view itself is gone is it worth another try.
+        if count or await page.is_visible('#hotelsearchtext'):
+            raise JobFailed(NOT_FOUND, "filter_hotel", "hotel not in the search results")
+        raise TimeoutError("search results never rendered")
+
+    async def open_details():
+        before = set(context.pages)
+        try:
+            async with context.expect_page(timeout=15000) as opened:
+                await title.click()
+            details = await opened.value
+            await details.bring_to_front()
+            await details.wait_for_load_state('load')
+            return details
+        except Exception:
+            # the next attempt clicks again: don't leave this attempt's tab behind
+            for tab in context.pages:
+                if tab not in before:
+                    await tab.close()
+            raise
+
+    await retry_step("open_search", open_search, **job)
+    await retry_step("select_city", select_city, **job)
+    await retry_step("set_dates", set_dates, **job)
+    await retry_step("search", search, **job)
+    try:
+        title = await retry_step("filter_hotel", filter_hotel, **job)
+    except JobFailed as e:
+        if e.outcome != NOT_FOUND:
+            raise
+        log_event(log, "hotel_not_found", logging.ERROR, **job)
+        return None
+    return await retry_step("open_details", open_details, **job)
+
+async def scrape_details_page(hotel_page, city, hotel_name, checkin, checkout, raw_dir: Path = None) -> str:
+    """Screenshot, wait for and extract the room table of an open details tab, then save the rows."""
+    job = {"city": city, "hotel": hotel_name, "checkin": checkin, "checkout": checkout}
+    safe_hotel = hotel_name.replace(" ", "_")
+    safe_date = checkin.replace("/", "-")
+
+    async def screenshot():
+        SCREEN_DIR.mkdir(exist_ok=True)
+        await hotel_page.screenshot(path=str(SCREEN_DIR / f"{safe_hotel}_{safe_date}.png"), full_page=True)
+
+    async def wait_table():
+        for _ in range(40):
+            count = await hotel_page.evaluate("""
+                () => {
+                    const table = document.querySelector("tbody.mobile_class");
+                    if (!table) return -1;
+                    return table.querySelectorAll("tr.color_no").length;
+                }
+            """)
+            if count > 0:
+                return True
+            await hotel_page.wait_for_timeout(1000)
+        if count < 0:
+            # the page never rendered its room table: reload and wait again
+            await hotel_page.reload(timeout=30000)
+            raise TimeoutError("room table never rendered")
+        return False
+
+    await retry_step("screenshot", screenshot, **job)
+    if not await retry_step("wait_table", wait_table, attempts=2, **job):
+        log_event(log, "table_empty", logging.WARNING, **job)
+        return NO_AVAILABILITY
+
+    with SCRAPE_STEP_SECONDS.time(step="extract"):
+        rows = hotel_page.locator("tbody.mobile_class tr.color_no")
+        extracted = []
+
+        for i in range(await rows.count()):
+            row = rows.nth(i)
+
+            # Room Name
+            try:
+                room_name_el = row.locator(".room_name")
+                if await room_name_el.count() > 0:
+                    room_name = await room_name_el.inner_text()
+                elif extracted:
+                    room_name = extracted[-1]["R"]
+                else:
+                    room_name = "N/A"
+            except:
+                room_name = "N/A"
+
+            if room_name == "N/A":
+                log_event(log, "row_missing_room_name", logging.WARNING, **job)
+                continue
+
+            # Meal Plan
+            try:
+                meal_plan = await row.locator(".icon_with_text > span:last-child").inner_text()
+            except:
+                meal_plan = "N/A"
+
+            # Price
+            try:
+                price = await row.locator("a.total_price .currencytext").first.inner_text()
+            except:
+                price = "N/A"
+
+            extracted.append({
+                "H": hotel_name.strip(),
+                "C": city.strip(),
+                "D": checkin.strip(),
+                "R": room_name.strip(),
+                "M": meal_plan.strip(),
+                "P": price.strip()
+            })
+
+    with SCRAPE_STEP_SECONDS.time(step="save"):
+        segment = raw_writer(raw_dir or RAW_DIR).append(
+            hotel_name.strip(), city.strip(), checkin.strip(), checkout.strip(), extracted)
+
+    ROWS_EXTRACTED.inc(len(extracted), city=city)
+    log_event(log, "rows_extracted", rows=len(extracted), segment=str(segment), **job)
+    return OK
+
+async def search_city_hotel(page, context, city, hotel_name, checkin, checkout, raw_dir: Path = None) -> str:
+    """
+    One scrape job, as a sequence of independently retried steps (resilience.retry_step).
+    Returns a final outcome (ok, no_availability, not_found, invalid_dates); raises
+    JobFailed for timeout, site_down and session_expired. Use scrape_job() to count it.
+    """
+    if not (validate_date(checkin) and validate_date(checkout)):
+        log_event(log, "invalid_dates", logging.ERROR, city=city, hotel=hotel_name,
+                  checkin=checkin, checkout=checkout)
+        return INVALID_DATES
+
+    hotel_page = await open_hotel_details(page, context, city, hotel_name, checkin, checkout)
+    if hotel_page is None:
+        return NOT_FOUND
+    try:
+        return await scrape_details_page(hotel_page, city, hotel_name, checkin, checkout, raw_dir)
+    finally:
+        await hotel_page.close()
 
-                    await page.goto("https://business.myhotels.sa/")
+def _job_failed(e: Exception, **job) -> str:
+    outcome = classify_error(e)
+    log_event(log, "search_failed", logging.ERROR, outcome=outcome, step=getattr(e, "step", None),
+              error=str(e)[:300], **job)
+    return outcome
+
+async def scrape_job(page, context, city, hotel_name, checkin, checkout, raw_dir: Path = None,
+                     interactive: bool = True) -> str:
+    """search_city_hotel with its outcome classified and counted; an expired session is signed in again once."""
+    job = {"city": city, "hotel": hotel_name, "checkin": checkin, "checkout": checkout}
+    for attempt in (1, 2):
+        try:
+            outcome = await search_city_hotel(page, context, city, hotel_name, checkin, checkout, raw_dir=raw_dir)
+        except Exception as e:
+            outcome = _job_failed(e, **job)
+            if outcome == SESSION_EXPIRED and attempt == 1:
+                if await resume_session(page, interactive, **job):
+                    continue
+        break
+    SCRAPE_JOBS.inc(outcome=outcome)
+    return outcome
+
+async def resume_session(page, interactive: bool, **job) -> bool:
+    """
+    sign_in again after a session_expired outcome; False (logged) if that fails too.
+    Without a person to ask (interactive=False) a failure raises SignInRequired instead:
+    every further job would expire the same way.
+    """
+    try:
+        await sign_in(page, interactive=interactive)
+        return True
+    except Exception as e:
+        log_event(log, "sign_in_failed", logging.ERROR, error=str(e)[:300], **job)
+        if not interactive:
+            raise e if isinstance(e, SignInRequired) else SignInRequired(str(e)) from e
+        return False
 
-                    # Fill login fields
-                    await page.fill("#AgencyCode", data.agentId)
-                    await page.fill("#UserName", data.username)
-                    await page.fill("#Password", data.password)
-                    await page.click("#LoginButton")
+# ============== Calendar mode: many dates from one details tab ==============
+CALENDAR_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d")
+
+def _date_param_role(name: str) -> Optional[str]:
+    """'checkin' / 'checkout' for query parameter names that say which date they carry."""
+    key = "".join(ch for ch in name.lower() if ch.isalnum())
+    if "checkin" in key or "arrival" in key:
+        return "checkin"
+    if "checkout" in key or "departure" in key:
+        return "checkout"
+    return None
+
+def calendar_url(url: str, checkin: str, checkout: str, new_checkin: str, new_checkout: str) -> Optional[str]:
+    """
+    `url` (a details page opened for checkin/checkout) with its check-in and check-out
+    query values swapped for the new dates, matched in any of CALENDAR_DATE_FORMATS.
+    Parameters are identified by name (checkIn, check_out, arrival, ...); only when no
+    name says which date it is, by the value matching exactly one of the old dates.
+    None unless both dates were found and replaced, i.e. the page can only be reached
+    through a new search.
+    """
+    def variants(old: str, new: str) -> Dict[str, str]:
+        old_d = datetime.strptime(old.strip(), "%d/%m/%Y")
+        new_d = datetime.strptime(new.strip(), "%d/%m/%Y")
+        return {old_d.strftime(fmt): new_d.strftime(fmt) for fmt in CALENDAR_DATE_FORMATS}
+
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    swaps = {"checkin": variants(checkin, new_checkin), "checkout": variants(checkout, new_checkout)}
+    by_name = any(_date_param_role(key) for key, _ in query)
+    rewritten, replaced = [], set()
+    for key, value in query:
+        role = _date_param_role(key)
+        if role is None and not by_name:
+            matches = [r for r, swap in swaps.items() if value in swap]
+            role = matches[0] if len(matches) == 1 else None  # same old dates: can't tell
+        if role is not None and value in swaps[role]:
+            value = swaps[role][value]
+            replaced.add(role)
+        rewritten.append((key, value))
+    if replaced != set(swaps):
+        return None
+    return urlunsplit(parts._replace(query=urlencode(rewritten)))
+
+async def scrape_hotel_calendar(page, context, city, hotel_name, dates: List[Tuple[str, str]],
+                                raw_dir: Path = None, interactive: bool = True,
+                                breaker: Optional[CircuitBreaker] = None) -> Dict[Tuple[str, str], str]:
+    """
+    Calendar mode for one hotel: search and open its details tab once, then for every
+    further (checkin, checkout) load the same tab with the dates rewritten in its URL
+    (calendar_url) and re-read the room table. Each date is saved and counted exactly as a
+    search_city_hotel job would be, and goes through `breaker` (wait before, record after)
+    like one. Until a tab is open (hotel not listed, a failure), each date is a full search;
+    if the details URL carries no dates, the rest fall back to scrape_job. A date that ends
+    session_expired signs in again once and is retried with a new search.
+    """
+    outcomes: Dict[Tuple[str, str], str] = {}
+    hotel_page, anchor, calendar = None, None, True
+
+    async def scrape_date(checkin, checkout, url, job) -> str:
+        nonlocal hotel_page, anchor
+        if hotel_page is None:
+            hotel_page = await open_hotel_details(page, context, city, hotel_name, checkin, checkout)
+            if hotel_page is None:
+                return NOT_FOUND
+            anchor = (hotel_page.url, checkin, checkout)
+            return await scrape_details_page(hotel_page, city, hotel_name, checkin, checkout, raw_dir)
+
+        async def goto():
+            await hotel_page.goto(url, timeout=30000)
+            if await hotel_page.is_visible("#txtSignInAgentcode"):
+                raise JobFailed(SESSION_EXPIRED, "calendar_goto", "redirected to the sign-in form")
+
+        await retry_step("calendar_goto", goto, **job)
+        return await scrape_details_page(hotel_page, city, hotel_name, checkin, checkout, raw_dir)
 
-                    # Check if OTP is requested
+    try:
+        for checkin, checkout in dates:
+            job = {"city": city, "hotel": hotel_name, "checkin": checkin, "checkout": checkout}
+            if breaker is not None:
+                await breaker.wait()
+            valid = validate_date(checkin) and validate_date(checkout)
+            url = None
+            if calendar and valid and hotel_page is not None:
+                url = calendar_url(anchor[0], anchor[1], anchor[2], checkin, checkout)
+                if url is None:
+                    log_event(log, "calendar_url_without_dates", logging.WARNING, url=anchor[0], **job)
+                    calendar = False
+                    await hotel_page.close()
+                    hotel_page = None
+
+            if not calendar or not valid:
+                outcome = await scrape_job(page, context, city, hotel_name, checkin, checkout,
+                                           raw_dir=raw_dir, interactive=interactive)
+            else:
+                for attempt in (1, 2):
                     try:
-                        otp_input = await page.wait_for_selector("#OtpCode", timeout=3000)
-                        if data.otp == "":
-                            await browser.close()
-                            return {
-                                "requiresOtp": True,
-                                "message": "OTP required. Please enter it."
-                            }
-
-                        await otp_input.fill(data.otp)
-                        await page.click("#OtpSubmit")
-
-                    except:
-                        # No OTP requested, continue
-                        pass
-
-                    # After OTP, check if redirected to dashboard
-                    if "dashboard" in page.url.lower():
-                        await browser.close()
-                        return {"success": True, "message": "Login successful."}
-                    else:
-                        await browser.close()
-                        return {"success": False, "message": "Login failed. Check credentials or OTP."}
+                        outcome = await scrape_date(checkin, checkout, url, job)
+                    except Exception as e:
+                        outcome = _job_failed(e, **job)
+                    if outcome != SESSION_EXPIRED or attempt == 2:
+                        break
+                    # the details tab is signed out as well: sign in, then a fresh search
+                    if hotel_page is not None:
+                        await hotel_page.close()
+                        hotel_page = None
+                    if not await resume_session(page, interactive, **job):
+                        break
+                SCRAPE_JOBS.inc(outcome=outcome)
+            if breaker is not None:
+                breaker.record(outcome)
+            outcomes[(checkin, checkout)] = outcome
+    finally:
+        if hotel_page is not None:
+            await hotel_page.close()
+    return outcomes
+
+
+async def launch_browser(p, profile_path: str):
+    return await p.chromium.launch_persistent_context(
+        profile_path,
+        headless=False,
+        channel="chrome",
+        args=["--disable-popup-blocking", "--disable-notifications"]
+    )
+
+async def sign_in(page, interactive: bool = True):
+    await page.goto(f"{MYHOTELS_BASE_URL}/")
+    await page.wait_for_timeout(5000)
+
+    # Login
+    if await page.is_visible("#txtSignInAgentcode"):
+        await page.fill('#txtSignInAgentcode', AGENT_ID)
+        await page.fill('#txtSignInUsername', AGENT_NAME)
+        await page.fill('#txtSignInPassword', PASSWORD)
+        await page.check('#chkRememberMe')
+        await page.click('#btnLogin')
+
+    # OTP (if needed)
+    try:
+        await page.wait_for_selector('#txtOtpId', timeout=10000)
+    except Exception:
+        log_event(log, "login_without_otp")
+        return
+    log_event(log, "otp_required")
+    if not interactive:
+        # worker processes have no stdin; log the profile in once with `main.py --workers N --login`
+        raise SignInRequired("OTP required but this session cannot prompt for it")
+    otp = input("🔑 Enter OTP here: ")
+    await page.fill('#txtOtpId', otp)
+    await page.click('#btnLogin1')
+    await page.wait_for_timeout(5000)
+
+def iter_hotels(config: Dict[str, Any]):
+    """(city, hotel) for every hotel in the config."""
+    for city, hotels in config.items():
+        if city == "dates":
+            continue
+        for hotel in hotels:
+            yield city, hotel
+
+def iter_jobs(config: Dict[str, Any]):
+    """(city, hotel, checkin, checkout) for every hotel and date pair in the config."""
+    for city, hotel in iter_hotels(config):
+        for checkin, checkout in config["dates"]:
+            yield city, hotel, checkin, checkout
+
+async def run(calendar: bool = False):
+    config = load_config()
+    breaker = CircuitBreaker()
 
+    async with async_playwright() as p:
+        # one search tab; detail tabs closed after every job, context recycled periodically
+        session = BrowserSession(lambda: launch_browser(p, CHROME_PROFILE_PATH), prepare=sign_in)
+        await session.start()
+
+        async def attempt(city, hotel, checkin, checkout, sweep):
+            await breaker.wait()
+            log_event(log, "search_started", city=city, hotel=hotel,
+                      checkin=checkin, checkout=checkout, sweep=sweep)
+            async with session.job() as (page, context):
+                outcome = await scrape_job(page, context, city, hotel, checkin, checkout)
+            breaker.record(outcome)
+            return outcome in FINAL_OUTCOMES
+
+        # Iterate config; jobs the site failed (timeout, site_down, ...) get one more go at the end
+        failed = []
+        if calendar:
+            # one details tab per hotel, dates swapped in its URL (see scrape_hotel_calendar)
+            for city, hotel in iter_hotels(config):
+                await breaker.wait()
+                log_event(log, "calendar_started", city=city, hotel=hotel, dates=len(config["dates"]))
+                # every date is a page load: recycling and memory sampling count dates, not hotels
+                async with session.job(weight=max(1, len(config["dates"]))) as (page, context):
+                    outcomes = await scrape_hotel_calendar(page, context, city, hotel, config["dates"],
+                                                           breaker=breaker)
+                for (checkin, checkout), outcome in outcomes.items():
+                    if outcome not in FINAL_OUTCOMES:
+                        failed.append((city, hotel, checkin, checkout))
+        else:
+            for job in iter_jobs(config):
+                if not await attempt(*job, sweep="first"):
+                    failed.append(job)
+        for city, hotel, checkin, checkout in failed:
+            if not await attempt(city, hotel, checkin, checkout, sweep="retry"):
+                log_event(log, "search_skipped", logging.WARNING, city=city,
+                          hotel=hotel, checkin=checkin)
+
+        await session.close()
+
+    await clean_and_save(config)
+
+# ============== Sharded mode: N worker processes sharing one SQLite queue ==============
+def worker_profile_path(worker_id: int) -> str:
+    # Chrome locks a profile directory, so every worker needs its own
+    return f"{CHROME_PROFILE_PATH}-worker{worker_id}"
+
+async def login_worker_profiles(workers: int):
+    """Interactive one-off login (OTP prompt included) for each worker profile."""
+    async with async_playwright() as p:
+        for worker_id in range(workers):
+            context = await launch_browser(p, worker_profile_path(worker_id))
+            page = await context.new_page()
+            log_event(log, "worker_profile_login", worker=worker_id)
+            await sign_in(page)
+            await context.close()
+
+# worker exit code when its profile is signed out and only `--login` can fix it
+EXIT_SIGNED_OUT = 3
+
+async def run_worker(worker_id: int, queue_path: str) -> int:
+    """
+    Lease and scrape jobs until the queue is empty; returns the process exit code. A
+    worker whose session can't be restored without a person (SignInRequired) hands its
+    job back unspent and stops with EXIT_SIGNED_OUT rather than failing every job it leases.
+    """
+    name = f"worker-{worker_id}"
+    out_dir = WORKERS_DIR / name
+    queue = WorkQueue(queue_path)
+    try:
+        async with async_playwright() as p:
+            session = BrowserSession(lambda: launch_browser(p, worker_profile_path(worker_id)),
+                                     prepare=lambda page: sign_in(page, interactive=False), name=name)
+            try:
+                await session.start()
+            except SignInRequired as e:
+                log_event(log, "worker_signed_out", logging.ERROR, worker=name, error=str(e))
+                await session.close()
+                return EXIT_SIGNED_OUT
+
+            breaker = CircuitBreaker()
+            while True:
+                await breaker.wait()  # before leasing, so a paused worker never sits on a lease
+                leased = queue.lease(name)
+                if leased is None:
+                    break
+                job_id, (city, hotel, checkin, checkout) = leased
+                log_event(log, "search_started", worker=name, city=city, hotel=hotel,
+                          checkin=checkin, checkout=checkout)
+                renewer = asyncio.create_task(keep_lease(queue, job_id, name))
+                try:
+                    async with session.job() as (page, context):
+                        outcome = await scrape_job(page, context, city, hotel, checkin, checkout,
+                                                   raw_dir=out_dir, interactive=False)
+                except SignInRequired as e:
+                    # not the job's fault: another worker (or the next run) takes it as new
+                    queue.release(job_id, name)
+                    log_event(log, "worker_signed_out", logging.ERROR, worker=name, job_id=job_id,
+                              error=str(e), city=city, hotel=hotel, checkin=checkin)
+                    write_textfile(name)
+                    await session.close()
+                    return EXIT_SIGNED_OUT
+                finally:
+                    renewer.cancel()
+                breaker.record(outcome)
+                owned = (queue.complete(job_id, name) if outcome in FINAL_OUTCOMES
+                         else queue.fail(job_id, name, outcome))
+                if not owned:
+                    # the lease expired and another worker has the job: this result is a duplicate
+                    log_event(log, "lease_lost", logging.WARNING, worker=name, job_id=job_id,
+                              outcome=outcome, city=city, hotel=hotel, checkin=checkin)
+                write_textfile(name)  # the parent's metrics server merges it in
+
+            await session.close()
+            return 0
+    finally:
+        queue.close()
+
+async def keep_lease(queue: WorkQueue, job_id: int, worker: str):
+    """Renew a job's lease every third of lease_seconds until cancelled, so long jobs keep it."""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not queue.renew(job_id, worker):
+            log_event(log, "lease_renew_failed", logging.WARNING, worker=worker, job_id=job_id)
+            return
+
+def _worker_process(worker_id: int, queue_path: str):
+    sys.exit(asyncio.run(run_worker(worker_id, queue_path)))
+
+def merge_worker_outputs(raw_dir: Path = RAW_DIR) -> int:
+    """Fold every worker's segments (and any legacy files) into hotel_data/; segment names never collide."""
+    raw_dir.mkdir(exist_ok=True)
+    files = sorted((fp for fp in WORKERS_DIR.glob("*/*") if fp.suffix == ".json" or is_segment(fp)),
+                   key=lambda fp: fp.stat().st_mtime)
+    for fp in files:
+        os.replace(fp, raw_dir / fp.name)
+    return len(files)
+
+async def run_sharded(workers: int, queue_path: str, fresh: bool = False):
+    import multiprocessing
+
+    config = load_config()
+    queue = WorkQueue(queue_path)
+    added = queue.enqueue(iter_jobs(config), reset=fresh)
+    log_event(log, "queue_ready", added=added, **queue.stats())
+
+    for stale in METRICS_DIR.glob("worker-*.prom"):
+        stale.unlink(missing_ok=True)  # from a run with more workers
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker_process, args=(i, queue_path), name=f"worker-{i}")
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        await asyncio.to_thread(proc.join)
+        if proc.exitcode == EXIT_SIGNED_OUT:
+            log_event(log, "worker_exited", logging.ERROR, worker=proc.name, exitcode=proc.exitcode,
+                      hint="profile signed out: run main.py --workers N --login")
+        elif proc.exitcode:
+            log_event(log, "worker_exited", logging.ERROR, worker=proc.name, exitcode=proc.exitcode)
+
+    stats = queue.stats()
+    queue.close()
+    log_event(log, "queue_drained", merged=merge_worker_outputs(), **stats)
+    await clean_and_save(config)
+
+async def clean_and_save(config: Dict[str, Any]):
+    # Run cleaning script (unchanged)
+    log_event(log, "cleaner_started")
+    CLEAN_DIR.mkdir(exist_ok=True)
+    result = subprocess.run([sys.executable, "clean_with_openai.py"])
+    if result.returncode != 0:
+        log_event(log, "cleaner_failed", logging.ERROR, returncode=result.returncode)
+        return
+
+    # -------- NEW: Load ALL cleaned files, parse hotel/date from filename, map city, then save --------
+    hotel_to_city = build_hotel_to_city_map(config)
+    if not any(p.suffix == ".json" or is_segment(p) for p in CLEAN_DIR.iterdir()):
+        log_event(log, "no_cleaned_files", logging.ERROR, folder=str(CLEAN_DIR))
+        return
+
+    normalized = normalize_cleaned_files(CLEAN_DIR, hotel_to_city)
+    normalized = screen_rows(normalized)
     if not normalized:
-        print("⚠️ No valid cleaned rows to save after normalization.")
+        log_event(log, "nothing_to_save", logging.WARNING)
         return
 
     summary = save_cleaned_rows_nested(normalized)
-    print(f"✅ Saved {summary.get('written', 0)} cleaned room docs to Firestore.")
+    log_event(log, "firestore_saved", rows=summary.get("written", 0),
+              duplicates=summary.get("duplicates", 0), rollups=summary.get("rollups", 0), batches=summary.get("batches", 0))
+    # live push to a running API, if PRICE_FEED_URL is set: the rows as stored, one per room doc
+    await asyncio.to_thread(forward_rows, summary.get("saved_rows", []))
+
+def screen_rows(rows: List[Dict[str, Any]], client=None) -> List[Dict[str, Any]]:
+    """
+    Hold back implausible prices (scraper glitches, currency/decimal slips) before they
+    reach Firestore and the live feed: each price is checked against the stored history
+    of its hotel/room/meal and the rest of the sweep (utils.anomalies). Flagged rows go
+    to QUARANTINE_DIR for review; the rest are returned. Rows quarantined by an earlier
+    run are dropped without being screened again.
+    """
+    from utils.anomalies import (quarantine_rows, quarantined, row_fingerprint,  # pandas: pipeline only
+                                 screen_prices, split_rows)
+
+    held = quarantined(QUARANTINE_DIR)
+    total = len(rows)
+    rows = [row for row in rows if row_fingerprint(row) not in held]
+    try:
+        history = load_month_history(rows, client=client)
+    except Exception as e:
+        # screening still works within the sweep, just without stored context
+        log_event(log, "price_history_failed", logging.WARNING, error=str(e))
+        history = []
+    keep, flagged = split_rows(rows, screen_prices(rows, history))
+    if flagged:
+        path = quarantine_rows(flagged, QUARANTINE_DIR)
+        reasons: Dict[str, int] = {}
+        for row in flagged:
+            for reason in row["anomaly"]["reasons"]:
+                reasons[reason] = reasons.get(reason, 0) + 1
+        log_event(log, "prices_quarantined", logging.WARNING, rows=len(flagged), file=str(path), **reasons)
+    log_event(log, "prices_screened", rows=total, history=len(history), kept=len(keep), flagged=len(flagged),
+              already_quarantined=total - len(rows))
+    return keep
 
 if __name__ == '__main__':
-    asyncio.run(run())
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Scrape myhotels.sa, clean and save to Firestore.")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Shard the sweep over N browser processes sharing a SQLite job queue")
+    ap.add_argument("--queue", default="work_queue.sqlite3", help="Queue file for --workers")
+    ap.add_argument("--fresh", action="store_true", help="Re-run jobs already done in the queue")
+    ap.add_argument("--login", action="store_true", help="Log every worker profile in (OTP) and exit")
+    ap.add_argument("--calendar", action="store_true",
+                    help="Open each hotel's details page once and sweep its dates there (single process)")
+    ap.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                    help="Serve this process's Prometheus metrics (plus worker/cleaner textfiles) "
+                         "at :PORT/metrics; 0 disables")
+    args = ap.parse_args()
+
+    if args.metrics_port and not args.login:
+        try:
+            start_metrics_server(args.metrics_port)
+            log_event(log, "metrics_server_started", port=args.metrics_port)
+        except OSError as e:
+            log_event(log, "metrics_server_failed", logging.WARNING, port=args.metrics_port, error=str(e))
+
+    if args.workers and args.login:
+        asyncio.run(login_worker_profiles(args.workers))
+    elif args.workers:
+        asyncio.run(run_sharded(args.workers, args.queue, args.fresh))
+    else:
+        asyncio.run(run(calendar=args.calendar))
@@ -0,0 +1,166 @@
+# price_feed.py
+"""
+In-process pub/sub for live room prices, served by main.py at /ws/prices.
+
+    hub.publish(rows)        # rows as passed to save_cleaned_rows_nested; any thread
+    sub = hub.subscribe(city="Makkah", date_from="2025-08-01", date_to="2025-08-31")
+    event = await sub.get()
+
+The hub remembers the last price per room doc (city, hotel, date, room id) and only
+publishes rows whose price changed, so re-saving a sweep sends nothing new. Every
+subscriber has a bounded queue; a client that falls behind loses its oldest events
+(counted in `dropped`) rather than growing memory or slowing the publisher.
+
+publish() may run on any thread (the pipeline's Firestore save runs in a worker
+thread); events reach subscriber queues on the event loop through call_soon_threadsafe.
+A pipeline running in another process forwards its saved rows (one per room doc, as
+returned in save_cleaned_rows_nested's "saved_rows") with forward_rows(), which POSTs
+them to the API's /prices/ingest when PRICE_FEED_URL is set. Both sides need the same
+PRICE_FEED_TOKEN: the API refuses ingest when it has none configured.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import urllib.request
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from save_nested import _as_date, _room_doc_id, _slug
+from utils.metrics import get_logger, log_event, counter
+
+log = get_logger("price_feed")
+
+PRICE_EVENTS = counter("price_feed_events_total", "Price change events published / dropped for slow clients")
+
+PRICE_FEED_URL = os.getenv("PRICE_FEED_URL", "").rstrip("/")
+PRICE_FEED_TOKEN = os.getenv("PRICE_FEED_TOKEN", "")
+
+class Subscription:
+    def __init__(self, hub: "PriceHub", loop: asyncio.AbstractEventLoop, maxsize: int,
+                 city: Optional[str] = None, hotel: Optional[str] = None,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None):
+        self.hub = hub
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.city = city.strip().lower() if city else None
+        self.hotel = hotel.strip().lower() if hotel else None
+        # ISO dates compare correctly as strings
+        self.date_from = _as_date(date_from).strftime("%Y-%m-%d") if date_from else None
+        self.date_to = _as_date(date_to).strftime("%Y-%m-%d") if date_to else None
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.city and event["city"].lower() != self.city:
+            return False
+        if self.hotel and event["hotel"].lower() != self.hotel:
+            return False
+        if self.date_from and event["date"] < self.date_from:
+            return False
+        if self.date_to and event["date"] > self.date_to:
+            return False
+        return True
+
+    def _put(self, events: List[Dict[str, Any]]):
+        # runs on the subscriber's loop
+        for event in events:
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+                PRICE_EVENTS.inc(kind="dropped")
+            self.queue.put_nowait(event)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class PriceHub:
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._last: Dict[Tuple[str, str, str, str], Optional[float]] = {}
+        self._subs: List[Subscription] = []
+
+    def subscribe(self, **filters) -> Subscription:
+        """Call from the event loop that will read the subscription."""
+        sub = Subscription(self, asyncio.get_running_loop(), self.maxsize, **filters)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def changes(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Rows whose price differs from the last one seen for the same room doc, as events.
+        Every row is parsed before any is recorded: a bad row raises with nothing marked
+        as seen, so the batch can be sent again without losing its changes.
+        """
+        parsed = []
+        for row in rows:
+            city, hotel = row["city"].strip(), row["hotel"].strip()
+            date = _as_date(row["date"]).strftime("%Y-%m-%d")
+            room_name, meal_plan = row["room_name"].strip(), (row.get("meal_plan") or "").strip()
+            price = float(row["price"]) if row.get("price") is not None else None
+            key = (_slug(city), _slug(hotel), date, _room_doc_id(room_name, meal_plan))
+            parsed.append((key, {
+                "city": city, "hotel": hotel, "date": date,
+                "room_name": room_name, "meal_plan": meal_plan, "price": price,
+                "currency": row.get("currency") or "SAR",
+                "scraped_at": str(row["scraped_at"]) if row.get("scraped_at") else None,
+            }))
+
+        events = []
+        with self._lock:
+            for key, event in parsed:
+                previous = self._last.get(key, "missing")
+                if previous == event["price"]:
+                    continue
+                self._last[key] = event["price"]
+                events.append({**event, "previous_price": None if previous == "missing" else previous})
+        return events
+
+    def publish(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Fan changed prices out to matching subscribers; returns the number of change events."""
+        events = self.changes(rows)
+        if not events:
+            return 0
+        PRICE_EVENTS.inc(len(events), kind="published")
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            mine = [e for e in events if sub.matches(e)]
+            if mine:
+                try:
+                    sub.loop.call_soon_threadsafe(sub._put, mine)
+                except RuntimeError:  # loop closed: the client is gone
+                    self.unsubscribe(sub)
+        return len(events)
+
+hub = PriceHub()
+
+def forward_rows(rows: List[Dict[str, Any]], url: str = PRICE_FEED_URL, timeout: float = 10.0) -> bool:
+    """Send saved rows to a running API's /prices/ingest (no-op unless PRICE_FEED_URL is set)."""
+    if not url or not rows:
+        return False
+    if not PRICE_FEED_TOKEN:
+        log_event(log, "price_feed_forward_skipped", logging.WARNING, url=url,
+                  reason="PRICE_FEED_TOKEN not set")
+        return False
+    body = json.dumps({"rows": rows}, ensure_ascii=False, default=str).encode("utf-8")
+    request = urllib.request.Request(f"{url}/prices/ingest", data=body, method="POST",
+                                     headers={"Content-Type": "application/json",
+                                              "X-Price-Feed-Token": PRICE_FEED_TOKEN})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            log_event(log, "price_feed_forwarded", rows=len(rows), status=response.status)
+        return True
+    except OSError as e:
+        # live push is best effort; Firestore already has the rows
+        log_event(log, "price_feed_forward_failed", logging.WARNING, url=url, error=str(e))
+        return False
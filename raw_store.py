@@ -0,0 +1,305 @@
+# raw_store.py
+"""
+Compressed JSON Lines segments for scraped (and cleaned) room rows.
+
+One line per scrape job, keyed by (hotel, checkin, checkout, scraped_at):
+
+    {"hotel": "Emaar Legend", "city": "Makkah", "checkin": "15/08/2025", "checkout": "16/08/2025",
+     "scraped_at": "2025-08-14T21:03:11Z", "rows": [{"R": "...", "M": "...", "P": "..."}, ...]}
+
+H/C/D are stored once per job rather than on every row and put back by the reader,
+so consumers keep seeing the legacy row shape.
+
+With durable=True (the scraper) every job is appended to the active segment as its
+own compressed member (gzip members and zstd frames concatenate into one valid
+stream) and fsync'ed, so a job costs one small write however full the segment is.
+A crash can only tear the last member; readers keep every job before it. Bulk
+writers pass durable=False: the segment is written once, to a temp file that is
+os.replace()d into place, when it rolls over after `max_jobs` jobs or on close().
+gzip is the default codec; zstd is used when asked for and the optional `zstandard`
+package is installed.
+
+Consumers that run repeatedly over a growing directory (the cleaner) keep a
+ProcessedLog and pass `only=` to iter_job_records, so each run reads new or grown
+files only.
+
+    python raw_store.py migrate hotel_data        # legacy <Hotel>_<dd-mm-yyyy>.json → segments
+"""
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+from utils.metrics import get_logger, log_event
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+log = get_logger("raw_store")
+
+GZIP_SUFFIX = ".jsonl.gz"
+ZSTD_SUFFIX = ".jsonl.zst"
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def is_segment(path: Path) -> bool:
+    return path.name.endswith(GZIP_SUFFIX) or path.name.endswith(ZSTD_SUFFIX)
+
+def write_atomic(path, data: bytes, fsync: bool = True):
+    """Write `data` to a temp file next to `path`, then os.replace() it into place."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def write_json_atomic(path, value: Any, fsync: bool = False):
+    write_atomic(path, json.dumps(value, ensure_ascii=False, indent=2).encode("utf-8"), fsync=fsync)
+
+# ============== Writing ==============
+class SegmentWriter:
+    def __init__(self, directory, prefix: str = "raw", max_jobs: int = 50, codec: str = "gzip",
+                 durable: bool = True):
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("codec='zstd' needs the zstandard package (pip install zstandard)")
+        if codec not in ("gzip", "zstd"):
+            raise ValueError(f"Unknown codec: {codec}")
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.max_jobs = max_jobs
+        self.codec = codec
+        self.durable = durable
+        self._dirty = False
+        self._lines: List[bytes] = []   # buffered jobs (durable=False only)
+        self._jobs = 0                  # jobs in the active segment
+        self._path: Optional[Path] = None
+        self._seq = 0
+
+    def append(self, hotel: str, city: str, checkin: str, checkout: str,
+               rows: List[Dict[str, Any]], scraped_at: Optional[str] = None) -> Path:
+        """Persist one job; returns the segment it landed in."""
+        job = {
+            "hotel": hotel, "city": city, "checkin": checkin, "checkout": checkout,
+            "scraped_at": scraped_at or utc_now(),
+            "rows": [{k: v for k, v in r.items() if k not in ("H", "C", "D")} for r in rows],
+        }
+        if self._path is None or self._jobs >= self.max_jobs:
+            self._flush()
+            self._roll()
+        line = json.dumps(job, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._jobs += 1
+        if self.durable:
+            self._append_member(line)
+        else:
+            self._lines.append(line)
+            self._dirty = True
+        return self._path
+
+    def close(self):
+        self._flush()
+        self._lines = []
+        self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _roll(self):
+        self._seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        suffix = ZSTD_SUFFIX if self.codec == "zstd" else GZIP_SUFFIX
+        self._path = self.directory / f"{self.prefix}-{stamp}-{os.getpid()}-{self._seq:04d}{suffix}"
+        self._lines = []
+        self._jobs = 0
+
+    def _flush(self):
+        if self._dirty:
+            self._write_atomic()
+            self._dirty = False
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=6).compress(payload)
+        return gzip.compress(payload, compresslevel=6, mtime=0)
+
+    def _write_atomic(self):
+        write_atomic(self._path, self._compress(b"".join(self._lines)))
+
+    def _append_member(self, line: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self._path, "ab") as f:
+            f.write(self._compress(line))
+            f.flush()
+            os.fsync(f.fileno())
+
+# ============== Reading ==============
+def _open_lines(path: Path):
+    if path.name.endswith(ZSTD_SUFFIX):
+        if zstandard is None:
+            raise RuntimeError(f"{path.name} needs the zstandard package (pip install zstandard)")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True, read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+def iter_segment_jobs(directory, only: Optional[Collection[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield jobs one line at a time, oldest segment first, rows back in legacy H/C/D/R/M/P
+    shape. `only` limits the read to those file names.
+    """
+    for path in sorted(p for p in Path(directory).iterdir() if is_segment(p)):
+        if only is not None and path.name not in only:
+            continue
+        try:
+            with _open_lines(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    job = json.loads(line)
+                    base = {"H": job["hotel"], "C": job["city"], "D": job["checkin"]}
+                    job["rows"] = [{**base, **r} for r in job["rows"]]
+                    yield job
+        except (OSError, EOFError, ValueError) as e:
+            log_event(log, "segment_unreadable", logging.WARNING, file=path.name, error=str(e))
+
+def job_filename(hotel: str, checkin: str, checkout: Optional[str] = None) -> str:
+    """
+    cleaned_data/ file name for one job: <Hotel>_<dd-mm-yyyy>_to_<dd-mm-yyyy>.json, so
+    stays with the same check-in and different check-outs don't overwrite each other.
+    Without a checkout (legacy files) it is the old <Hotel>_<dd-mm-yyyy>.json.
+    """
+    name = f"{hotel.replace(' ', '_')}_{checkin.replace('/', '-')}"
+    if checkout:
+        name += f"_to_{checkout.replace('/', '-')}"
+    return name + ".json"
+
+def iter_job_records(directory, only: Optional[Collection[str]] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    (name, records) for every legacy *.json file, then every segment job, so callers
+    can stream both formats through the same loop. Segment rows also carry
+    checkout/scraped_at. `only` limits the read to those file names (see ProcessedLog).
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        return
+    for path in sorted(directory.glob("*.json")):
+        if only is not None and path.name not in only:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except ValueError as e:
+            log_event(log, "legacy_file_unreadable", logging.WARNING, file=path.name, error=str(e))
+            continue
+        yield path.name, records
+    for job in iter_segment_jobs(directory, only):
+        extra = {"checkout": job["checkout"], "scraped_at": job["scraped_at"]}
+        yield job_filename(job["hotel"], job["checkin"], job["checkout"]), [{**r, **extra} for r in job["rows"]]
+
+# ============== Incremental reads ==============
+class ProcessedLog:
+    """
+    Input files a consumer has already handled, by name with size and mtime, kept in a
+    small JSON file. pending() lists the legacy files and segments that are new or have
+    grown since; mark() records them once they are handled. A different `fingerprint`
+    (the cleaner passes the catalog version) or reset=True starts over, so everything
+    is re-read.
+    """
+
+    def __init__(self, path, fingerprint: str = "", reset: bool = False):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self._files: Dict[str, List[int]] = {}
+        if reset:
+            return
+        try:
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            state = None
+        if isinstance(state, dict) and state.get("fingerprint") == fingerprint:
+            self._files = dict(state.get("files") or {})
+
+    def pending(self, directory) -> Dict[str, List[int]]:
+        """{file name: [size, mtime_ns]} for inputs not handled in their current state."""
+        directory = Path(directory)
+        if not directory.exists():
+            return {}
+        todo = {}
+        for path in directory.iterdir():
+            if not (path.suffix == ".json" or is_segment(path)):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            stamp = [st.st_size, st.st_mtime_ns]
+            if self._files.get(path.name) != stamp:
+                todo[path.name] = stamp
+        return todo
+
+    def mark(self, stamps: Dict[str, List[int]]):
+        """Record files as handled in the state pending() saw (a file that grew since stays pending)."""
+        self._files.update(stamps)
+
+    def save(self):
+        write_json_atomic(self.path, {"fingerprint": self.fingerprint, "files": self._files})
+
+# ============== Migration ==============
+def migrate_legacy_files(directory, delete: bool = False, codec: str = "gzip") -> int:
+    """
+    Fold legacy <Hotel>_<dd-mm-yyyy>.json files into segments. Those files never recorded
+    the checkout, so a one-night stay is assumed; scraped_at is the file's mtime.
+    """
+    directory = Path(directory)
+    migrated = 0
+    with SegmentWriter(directory, prefix="migrated", max_jobs=500, codec=codec, durable=False) as writer:
+        for path in sorted(directory.glob("*.json")):
+            try:
+                rows = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError as e:
+                log_event(log, "legacy_file_unreadable", logging.WARNING, file=path.name, error=str(e))
+                continue
+            if rows:
+                first = rows[0]
+                checkin = first["D"]
+                checkout = (datetime.strptime(checkin, "%d/%m/%Y") + timedelta(days=1)).strftime("%d/%m/%Y")
+                scraped_at = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                writer.append(first["H"], first["C"], checkin, checkout, rows, scraped_at=scraped_at)
+            migrated += 1
+            if delete:
+                path.unlink()
+    return migrated
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Raw data segment tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="Convert legacy per-file JSON into segments")
+    m.add_argument("directory", nargs="?", default="hotel_data")
+    m.add_argument("--delete", action="store_true", help="Remove the legacy files once migrated")
+    m.add_argument("--codec", choices=("gzip", "zstd"), default="gzip")
+    args = ap.parse_args()
+
+    if args.cmd == "migrate":
+        n = migrate_legacy_files(args.directory, delete=args.delete, codec=args.codec)
+        log_event(log, "migrated", files=n, directory=args.directory)
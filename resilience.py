@@ -0,0 +1,148 @@
+# resilience.py
+"""
+Failure handling for scrape jobs (main.search_city_hotel):
+
+  retry_step()      retries one step (goto, click, wait...) with exponential backoff, so a
+                    flaky last step no longer restarts the job from the search page
+  JobFailed         raised when a step gives up, carrying a classified outcome
+  CircuitBreaker    pauses the sweep after consecutive site-level failures, then lets a
+                    single probe job through before resuming
+
+Outcomes (the `outcome` label of scrape_jobs_total):
+
+  ok               rows saved
+  no_availability  hotel page opened but its room table stayed empty
+  not_found        hotel not in the search results for that city/date
+  invalid_dates    job config error
+  timeout          a step kept timing out
+  site_down        navigation/network errors or 5xx responses
+  session_expired  the site sent us back to the sign-in form
+  error            anything else
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from utils.metrics import get_logger, log_event, SCRAPE_STEP_SECONDS, STEP_RETRIES, CIRCUIT_TRANSITIONS
+
+log = get_logger("scraper")
+
+T = TypeVar("T")
+
+OK = "ok"
+NO_AVAILABILITY = "no_availability"
+NOT_FOUND = "not_found"
+INVALID_DATES = "invalid_dates"
+TIMEOUT = "timeout"
+SITE_DOWN = "site_down"
+SESSION_EXPIRED = "session_expired"
+ERROR = "error"
+
+# the site answered: the job is finished and retrying it would give the same answer
+FINAL_OUTCOMES = {OK, NO_AVAILABILITY, NOT_FOUND, INVALID_DATES}
+# the site itself is struggling: these trip the circuit breaker
+SITE_FAILURES = {TIMEOUT, SITE_DOWN}
+
+_SITE_DOWN_MARKERS = ("net::err_", "connection refused", "connection reset", "ns_error_",
+                      "target closed", "browser has been closed", "http 5")
+
+class SignInRequired(RuntimeError):
+    """The session expired and cannot be restored without a person (OTP prompt, bad login)."""
+
+class JobFailed(Exception):
+    def __init__(self, outcome: str, step: str, message: str = ""):
+        super().__init__(f"{step}: {message}" if message else step)
+        self.outcome = outcome
+        self.step = step
+
+def classify_error(exc: BaseException) -> str:
+    if isinstance(exc, JobFailed):
+        return exc.outcome
+    text = f"{type(exc).__name__}: {exc}".lower()
+    if "timeout" in text:
+        return TIMEOUT
+    if any(marker in text for marker in _SITE_DOWN_MARKERS):
+        return SITE_DOWN
+    return ERROR
+
+async def retry_step(step: str, fn: Callable[[], Awaitable[T]], attempts: int = 3,
+                     backoff: float = 1.0, max_backoff: float = 15.0, **job) -> T:
+    """
+    Run one scrape step, timed under scrape_step_seconds{step}. Timeouts and network
+    errors are retried up to `attempts` times (backoff * 2**n seconds, jittered);
+    JobFailed and unclassified errors are not, since repeating them won't help.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            with SCRAPE_STEP_SECONDS.time(step=step):
+                return await fn()
+        except JobFailed:
+            raise
+        except Exception as e:
+            outcome = classify_error(e)
+            if outcome not in SITE_FAILURES or attempt == attempts:
+                raise JobFailed(outcome, step, str(e)) from e
+            delay = min(max_backoff, backoff * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+            STEP_RETRIES.inc(step=step)
+            log_event(log, "step_retry", logging.WARNING, step=step, attempt=attempt, outcome=outcome,
+                      delay_s=round(delay, 2), error=str(e)[:200], **job)
+            await asyncio.sleep(delay)
+
+# ============== Circuit breaker ==============
+class CircuitBreaker:
+    """
+    closed → open after `threshold` consecutive site failures; open → half_open once
+    `cooldown` seconds have passed; the next job is the probe: success closes the
+    circuit, failure re-opens it with the cooldown doubled (up to `max_cooldown`).
+    Any answer from the site (ok, no_availability, not_found) counts as success. A probe
+    ending in session_expired or error also closes it: the site answered, just not with
+    rows. While closed, those two leave the failure count alone.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at: Optional[float] = None
+
+    def _transition(self, state: str, **fields):
+        CIRCUIT_TRANSITIONS.inc(state=state)
+        log_event(log, "circuit_" + state, logging.WARNING if state == "open" else logging.INFO,
+                  failures=self.failures, cooldown_s=self.cooldown, **fields)
+        self.state = state
+
+    def remaining(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - self.clock())
+
+    async def wait(self):
+        """Block while the circuit is open; returns once a job may run."""
+        delay = self.remaining()
+        if delay:
+            await asyncio.sleep(delay)
+        if self.state == "open":
+            self._transition("half_open")
+
+    def record(self, outcome: str):
+        if outcome in SITE_FAILURES:
+            self.failures += 1
+            if self.state == "half_open":
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.opened_at = self.clock()
+                self._transition("open", outcome=outcome)
+            elif self.state == "closed" and self.failures >= self.threshold:
+                self.opened_at = self.clock()
+                self._transition("open", outcome=outcome)
+        elif outcome in FINAL_OUTCOMES or self.state == "half_open":
+            if self.state != "closed":
+                self.cooldown = self.base_cooldown
+                self._transition("closed")
+            self.failures = 0
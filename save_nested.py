@@ -2,8 +2,7 @@
 from datetime import datetime
 from hashlib import sha1
 from typing import List, Dict, Any
-from firebase import db
-from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from utils.metrics import FIRESTORE_WRITES, BATCH_COMMIT_SECONDS
 
 def _slug(s: str) -> str:
     return "".join(c.lower() if c.isalnum() else "-" for c in s).strip("-")
@@ -22,6 +21,15 @@ def _as_date(value) -> datetime:
 
 import re
 
+def _as_timestamp(value):
+    """raw_store writes scraped_at as an ISO-8601 UTC string; Firestore wants a datetime."""
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return value
+
 def _room_doc_id(room_name: str, meal_plan: str) -> str:
     """
     Create a readable doc ID like 'Standard Triple Room - Breakfast Not Included'.
@@ -36,7 +44,112 @@ def _room_doc_id(room_name: str, meal_plan: str) -> str:
         safe = safe[:140].rstrip()
     return safe
 
-def save_cleaned_rows_nested(cleaned_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _month_rollups(cleaned_rows: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Per hotel per month summary, keyed by (city, hotel, 'YYYY-MM'):
+      days.<DD>.<room_id> = {room_name, meal_plan, min_price, last_price}
+    Values only depend on the rows passed in, so re-saving the same batch is idempotent.
+    """
+    rollups: Dict[tuple, Dict[str, Any]] = {}
+    for row in cleaned_rows:
+        city = row["city"].strip()
+        hotel = row["hotel"].strip()
+        date = _as_date(row["date"])
+        room_name = row["room_name"].strip()
+        meal_plan = (row.get("meal_plan") or "").strip()
+        price = float(row["price"]) if row.get("price") is not None else None
+
+        doc = rollups.setdefault((city, hotel, date.strftime("%Y-%m")), {
+            "city": city,
+            "hotel": hotel,
+            "month": date.strftime("%Y-%m"),
+            "days": {},
+        })
+        cell = doc["days"].setdefault(date.strftime("%d"), {}).setdefault(
+            _room_doc_id(room_name, meal_plan),
+            {"room_name": room_name, "meal_plan": meal_plan, "min_price": None, "last_price": None},
+        )
+        if price is not None:
+            cell["min_price"] = price if cell["min_price"] is None else min(cell["min_price"], price)
+            cell["last_price"] = price
+    return rollups
+
+def _city_date_rollups(cleaned_rows: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Per city per date summary, keyed by (city, 'YYYY-MM-DD'):
+      rooms.<room_id>.<hotel-slug> = {hotel, price}   # lowest price of that hotel
+    Each hotel owns its own leaf, so partial batches merge without clobbering other
+    hotels and the cheapest hotel per room type is a min() over one document.
+    """
+    rollups: Dict[tuple, Dict[str, Any]] = {}
+    for row in cleaned_rows:
+        if row.get("price") is None:
+            continue
+        city = row["city"].strip()
+        hotel = row["hotel"].strip()
+        date = _as_date(row["date"])
+        price = float(row["price"])
+
+        doc = rollups.setdefault((city, date.strftime("%Y-%m-%d")), {
+            "city": city,
+            "date": date,
+            "rooms": {},
+        })
+        hotels = doc["rooms"].setdefault(_room_doc_id(row["room_name"], row.get("meal_plan") or ""), {})
+        current = hotels.get(_slug(hotel))
+        if current is None or price < current["price"]:
+            hotels[_slug(hotel)] = {"hotel": hotel, "price": price}
+    return rollups
+
+def _previous_months(month: str, count: int) -> List[str]:
+    year, mon = int(month[:4]), int(month[5:7])
+    out = []
+    for _ in range(count):
+        year, mon = (year - 1, 12) if mon == 1 else (year, mon - 1)
+        out.append(f"{year:04d}-{mon:02d}")
+    return out
+
+def load_month_history(cleaned_rows: List[Dict[str, Any]], months_back: int = 1, client=None) -> List[Dict[str, Any]]:
+    """
+    Stored prices for the hotels in a sweep, read back from the Months rollups: the
+    months the sweep covers plus `months_back` before them, in one get_all() round trip.
+    Returned rows have the cleaned_rows shape (one per day/room, price = last_price),
+    so they can be screened together with the sweep (utils.anomalies).
+    """
+    wanted = set()
+    for row in cleaned_rows:
+        month = _as_date(row["date"]).strftime("%Y-%m")
+        for m in [month] + _previous_months(month, months_back):
+            wanted.add((row["city"].strip(), row["hotel"].strip(), m))
+    if not wanted:
+        return []
+
+    if client is None:
+        from firebase import get_db
+        client = get_db()
+    refs = [client.collection("City").document(_slug(city))
+                  .collection("Hotels").document(_slug(hotel))
+                  .collection("Months").document(month)
+            for city, hotel, month in sorted(wanted)]
+
+    history = []
+    for snap in client.get_all(refs):
+        if not snap.exists:
+            continue
+        doc = snap.to_dict()
+        for day, rooms in (doc.get("days") or {}).items():
+            for cell in rooms.values():
+                history.append({
+                    "city": doc.get("city", ""),
+                    "hotel": doc.get("hotel", ""),
+                    "date": f"{doc['month']}-{day}",
+                    "room_name": cell.get("room_name", ""),
+                    "meal_plan": cell.get("meal_plan", ""),
+                    "price": cell.get("last_price"),
+                })
+    return history
+
+def save_cleaned_rows_nested(cleaned_rows: List[Dict[str, Any]], rollups: bool = True, client=None) -> Dict[str, Any]:
     """
     cleaned_rows item example:
     {
@@ -51,27 +164,68 @@ def save_cleaned_rows_nested(cleaned_rows: List[Dict[str, Any]]) -> Dict[str, An
       "source": "myhotels.sa",
       "scraped_at": None
     }
+
+    With rollups=True the same batch also maintains summary docs, merged in place:
+      City/<city>/Hotels/<hotel>/Months/<yyyy-mm>   (see _month_rollups)
+      City/<city>/Dates/<yyyy-mm-dd>                (see _city_date_rollups)
+
+    client defaults to firebase.get_db(); pass any object with
+    the same collection()/batch() surface to write somewhere else (e.g. benchmarks).
+
+    The summary's "saved_rows" are the rows actually written, one per Rooms doc (several
+    rate plans of a room on one date collapse to the last one).
     """
     if not cleaned_rows:
-        return {"written": 0, "batches": 0}
+        return {"written": 0, "duplicates": 0, "batches": 0, "saved_rows": []}
+
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+    if client is None:
+        from firebase import get_db
+        client = get_db()
+    db = client
 
     written = 0
+    batches = 0
     batch = db.batch()
     ops_in_batch = 0
     max_ops = 450
 
+    def _commit():
+        nonlocal batches
+        with BATCH_COMMIT_SECONDS.time():
+            batch.commit()
+        batches += 1
+
+    def _set(ref, payload, kind):
+        nonlocal batch, ops_in_batch
+        batch.set(ref, payload, merge=True)
+        FIRESTORE_WRITES.inc(kind=kind)
+        ops_in_batch += 1
+        if ops_in_batch >= max_ops:
+            _commit()
+            batch = db.batch()
+            ops_in_batch = 0
+
+    # Several rate plans of one room type on one date land on the same Rooms/<id> doc.
+    # Every payload sets the same fields with merge=True, so the last row wins anyway:
+    # write only that one. Rollups below still see every row (min_price, last_price).
+    latest: Dict[tuple, tuple] = {}
     for row in cleaned_rows:
         city  = row["city"].strip()
         hotel = row["hotel"].strip()
         date  = _as_date(row["date"])
         room_name = row["room_name"].strip()
         meal_plan = (row.get("meal_plan") or "").strip()
+        room_id = _room_doc_id(room_name, meal_plan)
+        path = (_slug(city), _slug(hotel), date.strftime("%Y-%m-%d"), room_id)
+        latest[path] = (row, city, hotel, date, room_name, meal_plan)
 
+    for (city_slug, hotel_slug, day, room_id), (row, city, hotel, date, room_name, meal_plan) in latest.items():
         # Path: City/<city>/Hotels/<hotel>/Dates/<yyyy-mm-dd>/Rooms/<hash>
-        city_ref   = db.collection("City").document(_slug(city))
-        hotel_ref  = city_ref.collection("Hotels").document(_slug(hotel))
-        date_ref   = hotel_ref.collection("Dates").document(date.strftime("%Y-%m-%d"))
-        room_id = _room_doc_id(room_name, meal_plan)
+        city_ref   = db.collection("City").document(city_slug)
+        hotel_ref  = city_ref.collection("Hotels").document(hotel_slug)
+        date_ref   = hotel_ref.collection("Dates").document(day)
         room_ref = date_ref.collection("Rooms").document(room_id)
 
         payload = {
@@ -84,19 +238,33 @@ def save_cleaned_rows_nested(cleaned_rows: List[Dict[str, Any]]) -> Dict[str, An
             "currency": row.get("currency", "SAR"),
             "available": bool(row.get("available", True)),
             "source": row.get("source", "myhotels.sa"),
-            "scraped_at": row.get("scraped_at") or SERVER_TIMESTAMP,
+            "scraped_at": _as_timestamp(row.get("scraped_at")) or SERVER_TIMESTAMP,
         }
 
-        batch.set(room_ref, payload, merge=True)
-        ops_in_batch += 1
+        _set(room_ref, payload, "room")
         written += 1
 
-        if ops_in_batch >= max_ops:
-            batch.commit()
-            batch = db.batch()
-            ops_in_batch = 0
+    rollups_written = 0
+    if rollups:
+        for (city, hotel, month), doc in _month_rollups(cleaned_rows).items():
+            month_ref = (db.collection("City").document(_slug(city))
+                         .collection("Hotels").document(_slug(hotel))
+                         .collection("Months").document(month))
+            _set(month_ref, {**doc, "updated_at": SERVER_TIMESTAMP}, "month_rollup")
+            rollups_written += 1
+
+        for (city, day), doc in _city_date_rollups(cleaned_rows).items():
+            day_ref = db.collection("City").document(_slug(city)).collection("Dates").document(day)
+            _set(day_ref, {**doc, "updated_at": SERVER_TIMESTAMP}, "city_date_rollup")
+            rollups_written += 1
 
     if ops_in_batch:
-        batch.commit()
+        _commit()
+
+    # live subscribers (/ws/prices) get the rows whose price changed, once they are stored
+    from price_feed import hub
+    saved_rows = [row for row, *_ in latest.values()]
+    hub.publish(saved_rows)
 
-    return {"written": written, "batches": (written // max_ops) + (1 if written % max_ops else 0)}
+    return {"written": written, "duplicates": len(cleaned_rows) - written,
+            "rollups": rollups_written, "batches": batches, "saved_rows": saved_rows}
@@ -0,0 +1,164 @@
+# simulator/bench_scraper.py
+"""
+Scraper throughput against the local simulator (simulator/site.py).
+
+Starts the simulated site in-process, then runs main.scrape_job for `--jobs`
+(city, hotel, checkin, checkout) jobs at each concurrency level. Every worker owns a
+browser context with one search tab, as the scraper expects. Prints JSON with
+jobs/min and per-job latency per level:
+
+    python simulator/bench_scraper.py --jobs 20 --concurrency 1,2,4 --render-delay 1500
+    python simulator/bench_scraper.py --jobs 20 --concurrency 1 --calendar
+"""
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+import uvicorn
+from playwright.async_api import async_playwright
+
+import main
+from browser_session import BrowserSession
+from simulator.site import create_app, load_fixtures
+from resilience import ERROR, FINAL_OUTCOMES, SESSION_EXPIRED, SITE_FAILURES
+from utils.metrics import SCRAPE_JOBS
+
+Job = Tuple[str, str, str, str]
+
+def start_server(app, host: str, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def build_jobs(raw_dir: Path, count: int) -> List[Job]:
+    fixtures = load_fixtures(raw_dir)
+    base = [(city, hotel, checkin, checkin)
+            for city, hotels in sorted(fixtures.items())
+            for hotel, by_date in sorted(hotels.items())
+            for checkin in sorted(by_date)]
+    return [base[i % len(base)] for i in range(count)]
+
+def outcome_counts() -> Dict[str, float]:
+    return {o: SCRAPE_JOBS.value(outcome=o) for o in FINAL_OUTCOMES | SITE_FAILURES | {SESSION_EXPIRED, ERROR}}
+
+def group_jobs(jobs: List[Job], calendar: bool) -> List[Tuple[str, str, List[Tuple[str, str]]]]:
+    """Queue items: one per job, or in calendar mode one per hotel with all its dates."""
+    if not calendar:
+        return [(city, hotel, [(checkin, checkout)]) for city, hotel, checkin, checkout in jobs]
+    groups: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+    for city, hotel, checkin, checkout in jobs:
+        groups.setdefault((city, hotel), []).append((checkin, checkout))
+    return [(city, hotel, dates) for (city, hotel), dates in groups.items()]
+
+async def run_calendar(page, context, city, hotel, dates) -> List[str]:
+    return list((await main.scrape_hotel_calendar(page, context, city, hotel, dates)).values())
+
+async def run_single(page, context, city, hotel, dates) -> List[str]:
+    return [await main.scrape_job(page, context, city, hotel, *dates[0])]
+
+async def run_level(browser, jobs: List[Job], concurrency: int, calendar: bool = False,
+                    recycle_after: int = 0) -> Dict[str, Any]:
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in group_jobs(jobs, calendar):
+        queue.put_nowait(item)
+    latencies: List[float] = []
+    errors = 0
+    sessions: List[BrowserSession] = []
+    before = outcome_counts()
+
+    async def worker():
+        nonlocal errors
+        session = BrowserSession(browser.new_context, max_jobs=recycle_after, name=f"bench-{len(sessions)}")
+        sessions.append(session)
+        await session.start()
+        try:
+            while not queue.empty():
+                city, hotel, dates = queue.get_nowait()
+                started = time.perf_counter()
+                async with session.job(weight=len(dates)) as (page, context):
+                    outcomes = await (run_calendar(page, context, city, hotel, dates) if calendar
+                                      else run_single(page, context, city, hotel, dates))
+                errors += sum(outcome not in FINAL_OUTCOMES for outcome in outcomes)
+                # per-date latency, so both modes compare directly
+                latencies.extend([(time.perf_counter() - started) / len(dates)] * len(dates))
+        finally:
+            await session.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    after = outcome_counts()
+    ordered = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "jobs": len(jobs),
+        "elapsed_s": round(elapsed, 3),
+        "jobs_per_min": round(len(jobs) / elapsed * 60, 2),
+        "latency_p50_s": round(statistics.median(ordered), 3),
+        "latency_p95_s": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3),
+        "latency_max_s": round(ordered[-1], 3),
+        "errors": errors,
+        "context_recycles": sum(session.recycles for session in sessions),
+        "outcomes": {k: after[k] - before[k] for k in after if after[k] - before[k]},
+    }
+
+async def bench(args) -> Dict[str, Any]:
+    raw_dir = Path(args.fixtures)
+    server = start_server(create_app(raw_dir, args.render_delay, args.search_delay, args.empty_rate),
+                          args.host, args.port)
+    work = Path(tempfile.mkdtemp(prefix="bench_scraper_"))
+    main.MYHOTELS_BASE_URL = f"http://{args.host}:{args.port}"
+    main.RAW_DIR, main.SCREEN_DIR = work / "hotel_data", work / "screenshots"
+    jobs = build_jobs(raw_dir, args.jobs)
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=not args.headed)
+            levels = [await run_level(browser, jobs, int(c), args.calendar, args.recycle_after) for c in args.concurrency.split(",")]
+            await browser.close()
+    finally:
+        server.should_exit = True
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        "config": {"jobs": args.jobs, "render_delay_ms": args.render_delay,
+                   "search_delay_ms": args.search_delay, "empty_rate": args.empty_rate,
+                   "calendar": args.calendar},
+        "levels": levels,
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Measure scraper throughput against the local simulator.")
+    ap.add_argument("--jobs", type=int, default=10)
+    ap.add_argument("--concurrency", default="1,2,4", help="Comma-separated worker counts")
+    ap.add_argument("--fixtures", default=str(ROOT / "hotel_data"))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--render-delay", type=int, default=1000)
+    ap.add_argument("--search-delay", type=int, default=500)
+    ap.add_argument("--empty-rate", type=float, default=0.0)
+    ap.add_argument("--headed", action="store_true")
+    ap.add_argument("--calendar", action="store_true", help="Sweep each hotel's dates from one details tab")
+    ap.add_argument("--recycle-after", type=int, default=0, help="Replace each worker's context after N jobs (0: never)")
+    ap.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = ap.parse_args()
+
+    logging.getLogger("scraper").setLevel(logging.ERROR)  # keep stdout for the report
+    out = json.dumps(asyncio.run(bench(args)), indent=2)
+    if args.output:
+        Path(args.output).write_text(out + "\n", encoding="utf-8")
+    else:
+        print(out)
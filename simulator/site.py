@@ -0,0 +1,179 @@
+# simulator/site.py
+"""
+Local stand-in for business.myhotels.sa, serving only what search_city_hotel touches:
+
+  /HotelSearch   #txtCityName + div.autocomplete-suggestion, readonly #txtCheckinDate /
+                 #txtCheckoutDate, #btnHotelSearch, #hotelsearchtext and span.p_name_title
+                 (clicking a title opens the details page in a new tab). Like the site, the
+                 filter box appears with the results, and a filter that matches nothing
+                 leaves the list empty, with no message
+  /HotelDetails  tbody.mobile_class tr.color_no rows, rendered after `render_delay_ms`
+
+Rooms and prices come from the hotel_data/ fixtures. A date without a fixture reuses one
+of that hotel's fixtures (picked deterministically), so any date range can be searched.
+
+    python simulator/site.py --port 8765 --render-delay 1500
+    MYHOTELS_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import json
+import random
+import sys
+import zlib
+from html import escape
+from pathlib import Path
+from typing import Dict, List
+
+from fastapi import FastAPI, Query
+from fastapi.responses import HTMLResponse, RedirectResponse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from raw_store import iter_job_records
+
+def load_fixtures(raw_dir: Path) -> Dict[str, Dict[str, Dict[str, List[dict]]]]:
+    """{city: {hotel: {'dd/mm/yyyy': rows}}} from hotel_data/ (legacy JSON files or segments)."""
+    fixtures: Dict[str, Dict[str, Dict[str, List[dict]]]] = {}
+    for _name, rows in iter_job_records(raw_dir):
+        if not rows:
+            continue
+        first = rows[0]
+        fixtures.setdefault(first["C"], {}).setdefault(first["H"], {})[first["D"]] = rows
+    return fixtures
+
+SEARCH_PAGE = """<!doctype html>
+<html><head><title>Hotel Search</title>
+<style>.autocomplete-suggestion{cursor:pointer;padding:2px}.p_name_title{cursor:pointer;display:block}</style>
+</head><body>
+<input id="txtCityName" autocomplete="off">
+<div id="suggestions"></div>
+<input id="txtCheckinDate" readonly>
+<input id="txtCheckoutDate" readonly>
+<button id="btnHotelSearch">Search</button>
+<div id="filter" style="display:none"><input id="hotelsearchtext"></div>
+<div id="results"></div>
+<script>
+const CITIES = __CITIES__;
+const SEARCH_DELAY = __SEARCH_DELAY__;
+let selectedCity = null, hotels = [];
+const city = document.getElementById('txtCityName');
+city.addEventListener('input', () => {
+  const q = city.value.trim().toLowerCase();
+  const box = document.getElementById('suggestions');
+  box.innerHTML = '';
+  if (!q) return;
+  Object.keys(CITIES).filter(c => c.toLowerCase().startsWith(q)).forEach(c => {
+    const el = document.createElement('div');
+    el.className = 'autocomplete-suggestion';
+    el.textContent = c + ', Saudi Arabia';
+    el.onclick = () => { selectedCity = c; city.value = el.textContent; box.innerHTML = ''; };
+    box.appendChild(el);
+  });
+});
+function render(filter) {
+  const res = document.getElementById('results');
+  res.innerHTML = '';
+  const ci = document.getElementById('txtCheckinDate').value;
+  const co = document.getElementById('txtCheckoutDate').value;
+  hotels.filter(h => !filter || h.toLowerCase().includes(filter)).forEach(h => {
+    const el = document.createElement('span');
+    el.className = 'p_name_title';
+    el.textContent = h;
+    el.onclick = () => window.open('/HotelDetails?' + new URLSearchParams({city: selectedCity, hotel: h, checkin: ci, checkout: co}), '_blank');
+    res.appendChild(el);
+  });
+}
+document.getElementById('btnHotelSearch').onclick = () => {
+  document.getElementById('results').innerHTML = '';
+  document.getElementById('filter').style.display = 'none';
+  setTimeout(() => {
+    hotels = CITIES[selectedCity] || [];
+    render('');
+    document.getElementById('filter').style.display = '';
+  }, SEARCH_DELAY);
+};
+document.getElementById('hotelsearchtext').addEventListener('keydown', e => {
+  if (e.key === 'Enter') render(e.target.value.trim().toLowerCase());
+});
+</script>
+</body></html>
+"""
+
+DETAILS_PAGE = """<!doctype html>
+<html><head><title>__TITLE__</title></head><body>
+<h1>__TITLE__</h1>
+<table><tbody class="mobile_class" id="rooms"></tbody></table>
+<template id="rows">__ROWS__</template>
+<script>
+setTimeout(() => {
+  document.getElementById('rooms').innerHTML = document.getElementById('rows').innerHTML;
+}, __RENDER_DELAY__);
+</script>
+</body></html>
+"""
+
+def render_rows(rows: List[dict]) -> str:
+    """One tr.color_no per rate; like the real site, only the first rate of a room carries .room_name."""
+    out, previous_room = [], None
+    for r in rows:
+        room_cell = "" if r["R"] == previous_room else f'<span class="room_name">{escape(r["R"])}</span>'
+        previous_room = r["R"]
+        out.append(
+            '<tr class="color_no">'
+            f"<td>{room_cell}</td>"
+            f'<td><div class="icon_with_text"><i></i><span>{escape(r["M"])}</span></div></td>'
+            f'<td><a class="total_price"><span class="currency">SAR</span> '
+            f'<span class="currencytext">{escape(r["P"])}</span></a></td>'
+            "</tr>"
+        )
+    return "".join(out)
+
+def create_app(raw_dir: Path = ROOT / "hotel_data",
+               render_delay_ms: int = 1000,
+               search_delay_ms: int = 500,
+               empty_rate: float = 0.0) -> FastAPI:
+    fixtures = load_fixtures(raw_dir)
+    cities = {city: sorted(hotels) for city, hotels in fixtures.items()}
+    app = FastAPI()
+
+    @app.get("/")
+    def home():
+        return RedirectResponse("/HotelSearch")
+
+    @app.get("/HotelSearch", response_class=HTMLResponse)
+    def hotel_search():
+        return (SEARCH_PAGE
+                .replace("__CITIES__", json.dumps(cities))
+                .replace("__SEARCH_DELAY__", str(search_delay_ms)))
+
+    @app.get("/HotelDetails", response_class=HTMLResponse)
+    def hotel_details(city: str = Query(...), hotel: str = Query(...),
+                      checkin: str = Query(...), checkout: str = Query("")):
+        by_date = fixtures.get(city, {}).get(hotel, {})
+        seed = zlib.crc32(f"{hotel}|{checkin}|{checkout}".encode())
+        if by_date and random.Random(seed).random() >= empty_rate:
+            rows = by_date.get(checkin) or by_date[sorted(by_date)[seed % len(by_date)]]
+        else:
+            rows = []
+        return (DETAILS_PAGE
+                .replace("__TITLE__", escape(hotel))
+                .replace("__ROWS__", render_rows(rows))
+                .replace("__RENDER_DELAY__", str(render_delay_ms)))
+
+    app.state.fixtures = fixtures
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="Serve a local stand-in for business.myhotels.sa")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--fixtures", default=str(ROOT / "hotel_data"))
+    ap.add_argument("--render-delay", type=int, default=1000, help="Room table render delay (ms)")
+    ap.add_argument("--search-delay", type=int, default=500, help="Search results delay (ms)")
+    ap.add_argument("--empty-rate", type=float, default=0.0, help="Share of details pages with no rooms")
+    args = ap.parse_args()
+    sys.exit(uvicorn.run(create_app(Path(args.fixtures), args.render_delay, args.search_delay, args.empty_rate),
+                         host=args.host, port=args.port))
@@ -0,0 +1,107 @@
+# test_anomalies.py
+"""
+Price screening (screen_prices / split_rows) and the quarantine index.
+
+    python -m pytest -q tests
+"""
+import json
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pandas")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from utils.anomalies import MIN_PRICE, quarantine_rows, quarantined, row_fingerprint, screen_prices, split_rows
+
+
+def _row(day, price, room="Deluxe Room", meal="Room Only", hotel="Hilton", city="Makkah"):
+    return {"city": city, "hotel": hotel, "date": (date(2026, 3, 1) + timedelta(days=day)).isoformat(),
+            "room_name": room, "meal_plan": meal, "price": price}
+
+
+def _reasons(rows, history=()):
+    return list(screen_prices(rows, history)["reasons"])
+
+
+def test_steady_series_is_clean():
+    rows = [_row(d, 500 + 10 * (d % 3)) for d in range(10)]
+    assert _reasons(rows) == [""] * 10
+
+
+def test_bounds_are_inclusive():
+    rows = [_row(0, MIN_PRICE), _row(0, MIN_PRICE - 0.01, room="Suite"), _row(0, 100_000.01, room="Twin")]
+    assert _reasons(rows) == ["", "out_of_bounds", "out_of_bounds"]
+
+
+def test_missing_price_is_flagged_and_never_history():
+    rows = [_row(0, None), _row(1, 500), _row(2, 510)]
+    assert _reasons(rows) == ["missing_price", "", ""]
+
+
+def test_outlier_gets_robust_z_and_jump():
+    rows = [_row(d, 500) for d in range(10)]
+    rows[5] = _row(5, 5000)
+    reasons = _reasons(rows)
+    assert reasons[5] == "robust_z,jump"
+    assert reasons[:5] + reasons[6:] == [""] * 9
+
+
+def test_series_do_not_mix():
+    # a cheap room next to an expensive one of the same hotel is not an outlier
+    rows = [_row(d, 500) for d in range(5)] + [_row(d, 5000, room="Royal Suite") for d in range(5)]
+    assert _reasons(rows) == [""] * 10
+
+
+def test_history_gives_context_to_a_short_sweep():
+    history = [_row(d, 500) for d in range(8)]
+    assert _reasons([_row(8, 5000)]) == [""]  # alone: nothing to compare with
+    assert _reasons([_row(8, 5000)], history) == ["robust_z,jump"]
+
+
+def test_report_follows_input_order():
+    rows = [_row(3, 500), _row(0, 500, room="Suite"), _row(1, 500), _row(0, None), _row(2, 500)]
+    report = screen_prices(rows, [_row(0, 500)])
+    assert list(report.index) == list(range(len(rows)))
+    assert list(report["price"].fillna(-1)) == [500, 500, 500, -1, 500]
+    assert list(report["reasons"]) == ["", "", "", "missing_price", ""]
+
+
+def test_split_rows_explains_flagged_rows():
+    rows = [_row(d, 500) for d in range(10)]
+    rows[5] = _row(5, 5000)
+    keep, flagged = split_rows(rows, screen_prices(rows))
+    assert len(keep) == 9 and rows[5] not in keep
+    assert len(flagged) == 1
+    anomaly = flagged[0]["anomaly"]
+    assert anomaly["reasons"] == ["robust_z", "jump"]
+    assert anomaly["median"] == 500 and anomaly["prev_price"] == 500
+    assert anomaly["z"] > 5
+    assert {k: v for k, v in flagged[0].items() if k != "anomaly"} == rows[5]
+
+
+def test_split_rows_without_flags():
+    rows = [_row(d, 500) for d in range(3)]
+    assert split_rows(rows, screen_prices(rows)) == (rows, [])
+
+
+def test_quarantine_writes_each_row_once(tmp_path):
+    bad, other = _row(0, 5), _row(1, None)
+    first = quarantine_rows([bad, bad], tmp_path)
+    assert [json.loads(line) for line in first.read_text(encoding="utf-8").splitlines()] == [bad]
+    assert quarantine_rows([bad], tmp_path) is None  # the next run meets the same row
+    second = quarantine_rows([bad, other], tmp_path)
+    assert [json.loads(line)["price"] for line in second.read_text(encoding="utf-8").splitlines()] == [None]
+    assert quarantined(tmp_path) == {row_fingerprint(bad), row_fingerprint(other)}
+    assert not list(tmp_path.glob(".tmp-*"))
+
+
+def test_fingerprint_changes_with_a_new_scrape():
+    row = {**_row(0, 5), "scraped_at": "2026-03-01T10:00:00+00:00"}
+    assert row_fingerprint(row) == row_fingerprint(dict(row, anomaly={"reasons": ["out_of_bounds"]}))
+    assert row_fingerprint(row) != row_fingerprint(dict(row, scraped_at="2026-03-02T10:00:00+00:00"))
+    assert row_fingerprint(row) != row_fingerprint(dict(row, price=6))
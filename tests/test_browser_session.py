@@ -0,0 +1,129 @@
+# test_browser_session.py
+"""
+BrowserSession tab cleanup and recycling against a fake browser context.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from browser_session import BrowserSession
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+        self.context.pages.remove(self)
+
+
+class FakeContext:
+    def __init__(self, fail_close: bool = False):
+        self.pages = []
+        self.listeners = []
+        self.fail_close = fail_close
+        self.closed = False
+
+    def on(self, event, callback):
+        self.listeners.append(callback)
+
+    async def new_page(self) -> FakePage:
+        page = FakePage(self)
+        self.pages.append(page)
+        for callback in self.listeners:
+            callback(page)
+        return page
+
+    async def close(self):
+        if self.fail_close:
+            raise RuntimeError("browser has been closed")
+        self.closed = True
+
+
+def _session(contexts, **kwargs) -> BrowserSession:
+    async def launch():
+        return contexts.pop(0)
+
+    return BrowserSession(launch, sample_every=1000, **kwargs)
+
+
+def test_tabs_opened_by_a_job_are_closed():
+    async def scenario():
+        session = _session([FakeContext()])
+        await session.start()
+        async with session.job() as (page, context):
+            await context.new_page()
+            await context.new_page()
+        return session
+
+    session = asyncio.run(scenario())
+    assert session.context.pages == [session.page]
+
+
+def test_recycle_after_max_jobs():
+    async def scenario():
+        first, second = FakeContext(), FakeContext()
+        session = _session([first, second], max_jobs=2)
+        await session.start()
+        for _ in range(2):
+            async with session.job():
+                pass
+        return session, first, second
+
+    session, first, second = asyncio.run(scenario())
+    assert first.closed and session.context is second
+    assert session.recycles == 1 and session.jobs == 0
+
+
+def test_weighted_jobs_count_towards_recycling_and_sampling():
+    async def scenario():
+        session = _session([FakeContext(), FakeContext()], max_jobs=60)
+        session.sample_every = 10
+        samples = []
+
+        async def sample():
+            samples.append(session.total_jobs)
+            return {"tabs": 1, "uss_mb": None, "js_heap_mb": None}
+
+        session.sample = sample
+        await session.start()
+        async with session.job(weight=30):
+            pass
+        assert session.recycles == 0
+        async with session.job(weight=30):
+            pass
+        return session, samples
+
+    session, samples = asyncio.run(scenario())
+    assert samples == [30, 60]
+    assert session.recycles == 1
+
+
+def test_failed_recycle_does_not_mask_the_job_error():
+    async def scenario():
+        session = _session([FakeContext(), FakeContext()], max_jobs=1)
+        session.recycle = lambda reason: _raise(RuntimeError("relaunch failed"))
+        await session.start()
+        with pytest.raises(ValueError):
+            async with session.job():
+                raise ValueError("job failed")
+        return session
+
+    session = asyncio.run(scenario())
+    assert session.context is None  # the next job() starts a fresh context
+
+
+async def _raise(exc):
+    raise exc
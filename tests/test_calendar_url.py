@@ -0,0 +1,49 @@
+# test_calendar_url.py
+"""
+main.calendar_url: rewriting a details-page URL for other dates.
+
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from main import calendar_url
+
+
+def _query(url):
+    return dict(parse_qsl(urlsplit(url).query))
+
+
+def test_named_parameters_in_the_site_format():
+    url = "http://x/HotelDetails?city=Makkah&hotel=A&checkin=15%2F08%2F2025&checkout=16%2F08%2F2025"
+    out = calendar_url(url, "15/08/2025", "16/08/2025", "20/08/2025", "22/08/2025")
+    assert _query(out) == {"city": "Makkah", "hotel": "A", "checkin": "20/08/2025", "checkout": "22/08/2025"}
+
+
+def test_names_win_over_values():
+    # same old dates (a zero-night job), plus an unrelated parameter holding one of them
+    url = "http://x/d?CheckInDate=15-08-2025&promo=2025-08-15&Check_Out=15-08-2025"
+    out = calendar_url(url, "15/08/2025", "15/08/2025", "20/08/2025", "21/08/2025")
+    assert _query(out) == {"CheckInDate": "20-08-2025", "promo": "2025-08-15", "Check_Out": "21-08-2025"}
+
+
+def test_unnamed_parameters_matched_by_value():
+    out = calendar_url("http://x/d?a=2025-08-15&b=2025-08-16&id=15082025",
+                       "15/08/2025", "16/08/2025", "20/08/2025", "21/08/2025")
+    assert _query(out) == {"a": "2025-08-20", "b": "2025-08-21", "id": "15082025"}
+
+
+def test_none_unless_both_dates_replaced():
+    assert calendar_url("http://x/d?hid=3", "15/08/2025", "16/08/2025", "20/08/2025", "21/08/2025") is None
+    assert calendar_url("http://x/d?arrival=2025-08-15&hid=3",
+                        "15/08/2025", "16/08/2025", "20/08/2025", "21/08/2025") is None
+    # a named check-out carrying something else than the old date
+    assert calendar_url("http://x/d?checkin=2025-08-15&checkout=2025-09-01",
+                        "15/08/2025", "16/08/2025", "20/08/2025", "21/08/2025") is None
+    # identical unnamed values: can't tell which is which
+    assert calendar_url("http://x/d?x=2025-08-15&y=2025-08-15",
+                        "15/08/2025", "15/08/2025", "20/08/2025", "21/08/2025") is None
@@ -0,0 +1,76 @@
+# test_comparer.py
+"""
+compare_price_frames and the row normalisation in front of it.
+
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from utils.comparer import compare_price_frames, compare_prices, to_price_frame, undercuts
+
+
+def _frame(*rows):
+    return to_price_frame([{"hotel": h, "room": r, "meal": m, "date": d, "price": p} for h, r, m, d, p in rows])
+
+
+def test_to_price_frame_normalises_names_dates_and_prices():
+    frame = to_price_frame([
+        {"H": " Emaar  Legend ", "R": "Standard Twin Room – RO", "M": "RO", "D": "31/08/2025", "P": "SAR 1,234.50"},
+        {"hotel": "emaar legend", "room_name": "standard twin room - ro", "meal_plan": "ro",
+         "date": "2025-08-31", "price": 99},
+    ])
+    assert frame["hotel"].tolist() == ["emaar legend", "emaar legend"]
+    assert frame["room"].nunique() == 1 and frame["meal"].tolist() == ["ro", "ro"]
+    assert frame["date"].tolist() == ["2025-08-31", "2025-08-31"]
+    assert frame["price"].tolist() == [1234.5, 99.0]
+
+
+def test_join_on_all_keys_and_gaps():
+    mine = _frame(("a", "twin", "ro", "2025-08-31", 100), ("a", "twin", "bb", "2025-08-31", 150),
+                  ("a", "twin", "ro", "2025-09-01", 100))
+    theirs = _frame(("a", "twin", "ro", "2025-08-31", 120), ("a", "twin", "bb", "2025-08-31", 140))
+    out = compare_price_frames(mine, theirs).sort_values("meal")
+    assert out["meal"].tolist() == ["bb", "ro"]  # 2025-09-01 has no match
+    assert out["gap"].tolist() == [-10.0, 20.0]
+    assert out["pct_gap"].round(2).tolist() == [-6.67, 20.0]
+
+
+def test_duplicate_keys_min_vs_first():
+    mine = _frame(("a", "twin", "ro", "2025-08-31", 100), ("a", "twin", "ro", "2025-08-31", 90))
+    theirs = _frame(("a", "twin", "ro", "2025-08-31", 130), ("a", "twin", "ro", "2025-08-31", 110))
+    cheapest = compare_price_frames(mine, theirs, how="min")
+    assert cheapest[["myhotels_price", "nozolinn_price"]].values.tolist() == [[90.0, 110.0]]
+    first = compare_price_frames(mine, theirs, how="first")
+    assert sorted(first["nozolinn_price"].tolist()) == [130.0, 130.0]
+    with pytest.raises(ValueError):
+        compare_price_frames(mine, theirs, how="max")
+
+
+def test_missing_prices_are_dropped_and_zero_price_has_no_pct():
+    mine = _frame(("a", "twin", "ro", "2025-08-31", None), ("a", "quad", "ro", "2025-08-31", 0))
+    theirs = _frame(("a", "twin", "ro", "2025-08-31", 100), ("a", "quad", "ro", "2025-08-31", 50))
+    out = compare_price_frames(mine, theirs)
+    assert out["room"].tolist() == ["quad"]
+    assert out["pct_gap"].isna().all()
+    assert len(undercuts(out, min_pct_gap=1000)) == 1  # no pct: only the absolute gap counts
+
+
+def test_undercut_thresholds_and_compare_prices():
+    comparison = compare_price_frames(
+        _frame(("a", "twin", "ro", "2025-08-31", 100), ("a", "quad", "ro", "2025-08-31", 100)),
+        _frame(("a", "twin", "ro", "2025-08-31", 105), ("a", "quad", "ro", "2025-08-31", 150)))
+    assert undercuts(comparison)["room"].tolist() == ["twin", "quad"]
+    assert undercuts(comparison, min_abs_gap=10)["room"].tolist() == ["quad"]
+    assert undercuts(comparison, min_pct_gap=60).empty
+
+    alerts = compare_prices(
+        [{"hotel": "A", "room": "Twin", "meal": "RO", "date": "31/08/2025", "price": 100}],
+        [{"hotel": "a", "room": "twin", "meal": "ro", "date": "2025-08-31", "price": 120}])
+    assert alerts == [{"hotel": "A", "room": "Twin", "meal": "ro", "date": "2025-08-31",
+                       "myhotels_price": 100, "nozolinn_price": 120.0}]
@@ -0,0 +1,186 @@
+# test_email_alert.py
+"""
+AlertDispatcher against a local aiosmtpd server standing in for Gmail
+(pip install aiosmtpd==1.4.6; the module is skipped without it).
+
+    python -m pytest -q tests
+"""
+import asyncio
+import json
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from utils.email_alert import AlertDispatcher
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Mailbox:
+    """aiosmtpd handler: keeps every message, refuses the first `fail_first` with a 451."""
+
+    def __init__(self, fail_first: int = 0):
+        self.messages = []
+        self.fail_first = fail_first
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        if self.fail_first:
+            self.fail_first -= 1
+            return "451 Try again later"
+        self.messages.append(envelope.content.decode("utf-8"))
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    def start(fail_first: int = 0):
+        mailbox = Mailbox(fail_first)
+        controller = aiosmtpd_controller.Controller(mailbox, hostname="127.0.0.1", port=_free_port())
+        controller.start()
+        started.append(controller)
+        return mailbox, controller.port
+
+    started = []
+    yield start
+    for controller in started:
+        controller.stop()
+
+
+def _dispatcher(port: int, state_path, **kwargs) -> AlertDispatcher:
+    options = dict(host="127.0.0.1", port=port, use_ssl=False, username="", sender="bot@example.com",
+                   to="ops@example.com", window_seconds=60, retry_backoff=0.01, state_path=str(state_path))
+    options.update(kwargs)
+    return AlertDispatcher(**options)
+
+
+def _alert(hotel="Emaar Legend", room="Standard Twin Room", date="2025-08-31", mine=350.0, theirs=420.0,
+           meal="ro"):
+    return {"hotel": hotel, "room": room, "meal": meal, "date": date,
+            "myhotels_price": mine, "nozolinn_price": theirs}
+
+
+def test_digest_per_hotel_over_one_connection(smtp, tmp_path):
+    mailbox, port = smtp()
+
+    async def scenario():
+        async with _dispatcher(port, tmp_path / "state.json", group_by="hotel") as alerts:
+            await alerts.enqueue(_alert(hotel="A", room="Double"))
+            await alerts.enqueue(_alert(hotel="A", room="Triple"))
+            await alerts.enqueue(_alert(hotel="B", room="Double"))
+        return alerts.stats
+
+    stats = asyncio.run(scenario())
+    assert stats["emails"] == 2
+    assert len(mailbox.messages) == 2
+    assert len(mailbox.sessions) == 1
+    subjects = sorted(line for m in mailbox.messages for line in m.splitlines() if line.startswith("Subject:"))
+    assert subjects == ["Subject: Price alerts: 1 room(s) at B", "Subject: Price alerts: 2 room(s) at A"]
+
+
+def test_cooldown_ignores_price_changes_and_survives_restart(smtp, tmp_path):
+    mailbox, port = smtp()
+    state = tmp_path / "state.json"
+
+    async def sweep(alert):
+        async with _dispatcher(port, state) as alerts:
+            await alerts.enqueue(alert)
+        return alerts.stats
+
+    first = asyncio.run(sweep(_alert(mine=350.0, theirs=420.0)))
+    second = asyncio.run(sweep(_alert(mine=340.0, theirs=430.0)))
+    third = asyncio.run(sweep(_alert(date="2025-09-01")))
+
+    assert (first["emails"], second["emails"], third["emails"]) == (1, 0, 1)
+    assert second["deduped"] == 1
+    assert len(mailbox.messages) == 2
+
+
+def test_meal_plans_of_one_room_are_separate_alerts(smtp, tmp_path):
+    mailbox, port = smtp()
+
+    async def scenario():
+        async with _dispatcher(port, tmp_path / "state.json") as alerts:
+            await alerts.enqueue(_alert(meal="ro"))
+            await alerts.enqueue(_alert(meal="bb"))
+            await alerts.enqueue(_alert(meal="bb", mine=340.0))
+        return alerts.stats
+
+    stats = asyncio.run(scenario())
+    assert stats["deduped"] == 1
+    body = mailbox.messages[0]
+    assert "Standard Twin Room (ro) on 2025-08-31" in body and "Standard Twin Room (bb) on 2025-08-31" in body
+
+
+def test_failed_digest_is_requeued_and_delivered(smtp, tmp_path):
+    mailbox, port = smtp(fail_first=2)
+
+    async def scenario():
+        alerts = _dispatcher(port, tmp_path / "state.json", max_retries=1, requeue_seconds=0.05)
+        await alerts.start()
+        await alerts.enqueue(_alert())
+        await alerts.flush()  # two attempts, both refused: back on the pending list
+        assert alerts.stats["requeued"] == 1 and not mailbox.messages
+        for _ in range(100):
+            if mailbox.messages:
+                break
+            await asyncio.sleep(0.02)
+        await alerts.close()
+        return alerts.stats
+
+    stats = asyncio.run(scenario())
+    assert len(mailbox.messages) == 1
+    assert stats["emails"] == 1 and stats["unsent"] == 0
+
+
+def test_unsent_alerts_are_reported_on_close(tmp_path):
+    port = _free_port()  # nothing listening
+
+    async def scenario():
+        async with _dispatcher(port, tmp_path / "state.json", max_retries=0, requeue_seconds=60) as alerts:
+            await alerts.enqueue(_alert())
+        return alerts.stats
+
+    stats = asyncio.run(scenario())
+    assert stats["failed"] == 1 and stats["unsent"] == 1
+    assert json.loads((tmp_path / "state.json").read_text()) == {}
+
+
+def test_flush_raises_when_worker_died(smtp, tmp_path):
+    _, port = smtp()
+
+    async def scenario():
+        alerts = _dispatcher(port, tmp_path / "state.json")
+
+        async def broken():
+            raise ValueError("boom")
+
+        alerts._send_pending = broken
+        await alerts.start()
+        await alerts.enqueue(_alert())
+        with pytest.raises(RuntimeError) as excinfo:
+            await asyncio.wait_for(alerts.flush(), timeout=5)
+        assert isinstance(excinfo.value.__cause__, ValueError)
+        await alerts.close()  # logs the failure instead of raising or hanging
+
+    asyncio.run(scenario())
+
+
+def test_corrupt_state_file_starts_empty(tmp_path):
+    state = tmp_path / "state.json"
+    state.write_text("{not json", encoding="utf-8")
+    assert _dispatcher(1, state)._sent_at == {}
+    state.write_text("[1, 2]", encoding="utf-8")
+    assert _dispatcher(1, state)._sent_at == {}
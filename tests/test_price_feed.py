@@ -0,0 +1,87 @@
+# test_price_feed.py
+"""
+PriceHub change detection and the /prices/ingest endpoint.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from price_feed import PriceHub
+
+
+def _row(price=350.0, date="31-08-2025", room="Standard Twin Room - RO", **extra):
+    return {"city": "Makkah", "hotel": "Emaar Legend", "date": date, "room_name": room,
+            "meal_plan": "RO", "price": price, **extra}
+
+
+def test_only_price_changes_are_events():
+    hub = PriceHub()
+    first = hub.changes([_row(350.0), _row(400.0, room="Standard Triple Room - RO")])
+    assert [e["previous_price"] for e in first] == [None, None]
+    assert first[0]["date"] == "2025-08-31"
+    assert hub.changes([_row(350.0)]) == []
+    (event,) = hub.changes([_row(340.0)])
+    assert (event["price"], event["previous_price"]) == (340.0, 350.0)
+
+
+def test_bad_row_marks_nothing_as_seen():
+    hub = PriceHub()
+    with pytest.raises(ValueError):
+        hub.changes([_row(350.0), _row(360.0, date="not a date")])
+    assert hub.changes([_row(350.0)])  # still a change: the failed batch recorded nothing
+
+
+def test_subscribers_get_matching_events():
+    hub = PriceHub()
+
+    async def scenario():
+        makkah = hub.subscribe(city="makkah", date_from="2025-08-01", date_to="2025-08-31")
+        other = hub.subscribe(city="Madinah")
+        assert hub.publish([_row(350.0), _row(300.0, date="01-09-2025")]) == 2
+        await asyncio.sleep(0)  # call_soon_threadsafe delivery
+        got = await asyncio.wait_for(makkah.get(), 1)
+        assert got["date"] == "2025-08-31" and makkah.queue.empty() and other.queue.empty()
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def api(monkeypatch):
+    testclient = pytest.importorskip("fastapi.testclient")
+    import main
+    monkeypatch.setattr(main, "PRICE_FEED_TOKEN", "s3cret")
+    monkeypatch.setattr(main, "price_hub", PriceHub())
+    return testclient.TestClient(main.app), main
+
+
+def test_ingest_requires_the_token(api, monkeypatch):
+    client, main = api
+    assert client.post("/prices/ingest", json={"rows": [_row()]}).status_code == 403
+    monkeypatch.setattr(main, "PRICE_FEED_TOKEN", "")
+    assert client.post("/prices/ingest", json={"rows": [_row()]},
+                       headers={"X-Price-Feed-Token": ""}).status_code == 503
+
+
+@pytest.mark.parametrize("bad", [
+    {"room_name": None}, {"date": "31st of August"}, {"hotel": "  "}, {"price": "cheap"},
+])
+def test_ingest_rejects_bad_rows_with_422(api, bad):
+    client, main = api
+    rows = [_row(), {**_row(room="Standard Triple Room - RO"), **bad}]
+    response = client.post("/prices/ingest", json={"rows": rows}, headers={"X-Price-Feed-Token": "s3cret"})
+    assert response.status_code == 422
+    assert main.price_hub.changes([_row()])  # nothing from the rejected batch was recorded
+
+
+def test_ingest_publishes(api):
+    client, _ = api
+    response = client.post("/prices/ingest", json={"rows": [_row(), _row()]},
+                           headers={"X-Price-Feed-Token": "s3cret"})
+    assert response.status_code == 200 and response.json() == {"events": 1}
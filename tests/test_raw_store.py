@@ -0,0 +1,128 @@
+# test_raw_store.py
+"""
+raw_store segments (durable and bulk), torn tails, job_filename and ProcessedLog.
+
+    python -m pytest -q tests
+"""
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+import raw_store
+from raw_store import ProcessedLog, SegmentWriter, iter_job_records, iter_segment_jobs, job_filename
+
+
+def _rows(n, price=100):
+    return [{"H": "Emaar Legend", "C": "Makkah", "D": "15/08/2025", "R": f"Room {i}", "M": "RO", "P": str(price + i)}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("durable", [True, False])
+def test_round_trip_restores_legacy_row_shape(tmp_path, durable):
+    with SegmentWriter(tmp_path, max_jobs=2, durable=durable) as writer:
+        for day in ("15/08/2025", "16/08/2025", "17/08/2025"):
+            writer.append("Emaar Legend", "Makkah", day, "18/08/2025", _rows(2), scraped_at="2025-08-14T00:00:00Z")
+    segments = sorted(p for p in tmp_path.iterdir() if raw_store.is_segment(p))
+    assert len(segments) == 2  # rolled over after max_jobs
+    jobs = list(iter_segment_jobs(tmp_path))
+    assert [j["checkin"] for j in jobs] == ["15/08/2025", "16/08/2025", "17/08/2025"]
+    assert jobs[1]["rows"][0] == {"H": "Emaar Legend", "C": "Makkah", "D": "16/08/2025",
+                                  "R": "Room 0", "M": "RO", "P": "100"}
+    assert not list(tmp_path.glob(".tmp-*"))
+
+
+def test_durable_writer_appends_one_member_per_job(tmp_path):
+    writer = SegmentWriter(tmp_path, max_jobs=10)
+    path = writer.append("A", "Makkah", "15/08/2025", "16/08/2025", _rows(1))
+    size = path.stat().st_size
+    writer.append("A", "Makkah", "16/08/2025", "17/08/2025", _rows(1))
+    # visible without close(): each job is already on disk
+    assert path.stat().st_size > size
+    assert len(list(iter_segment_jobs(tmp_path))) == 2
+
+
+def test_torn_last_member_keeps_earlier_jobs(tmp_path):
+    writer = SegmentWriter(tmp_path, max_jobs=10)
+    path = writer.append("A", "Makkah", "15/08/2025", "16/08/2025", _rows(1))
+    first = path.stat().st_size
+    writer.append("A", "Makkah", "16/08/2025", "17/08/2025", _rows(20))
+    path.write_bytes(path.read_bytes()[:first + 40])  # crash mid-write of the second job
+    jobs = list(iter_segment_jobs(tmp_path))
+    assert [j["checkin"] for j in jobs] == ["15/08/2025"]
+
+
+def test_zstd_segments_when_available(tmp_path):
+    pytest.importorskip("zstandard")
+    writer = SegmentWriter(tmp_path, codec="zstd")
+    writer.append("A", "Makkah", "15/08/2025", "16/08/2025", _rows(1))
+    writer.append("A", "Makkah", "16/08/2025", "17/08/2025", _rows(1))
+    assert len(list(iter_segment_jobs(tmp_path))) == 2
+
+
+def test_job_records_cover_legacy_files_and_segments(tmp_path):
+    (tmp_path / "Emaar_Legend_14-08-2025.json").write_text(json.dumps(_rows(1)), encoding="utf-8")
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+    with SegmentWriter(tmp_path) as writer:
+        writer.append("Emaar Legend", "Makkah", "15/08/2025", "17/08/2025", _rows(1), scraped_at="t")
+    names = dict(iter_job_records(tmp_path))
+    assert set(names) == {"Emaar_Legend_14-08-2025.json", "Emaar_Legend_15-08-2025_to_17-08-2025.json"}
+    seg_row = names["Emaar_Legend_15-08-2025_to_17-08-2025.json"][0]
+    assert seg_row["checkout"] == "17/08/2025" and seg_row["scraped_at"] == "t"
+    only = dict(iter_job_records(tmp_path, only={"Emaar_Legend_14-08-2025.json"}))
+    assert list(only) == ["Emaar_Legend_14-08-2025.json"]
+
+
+def test_job_filename():
+    assert job_filename("Emaar Legend", "15/08/2025") == "Emaar_Legend_15-08-2025.json"
+    assert job_filename("Emaar Legend", "15/08/2025", "17/08/2025") == "Emaar_Legend_15-08-2025_to_17-08-2025.json"
+
+
+def test_processed_log_tracks_new_and_grown_files(tmp_path):
+    inputs, state = tmp_path / "in", tmp_path / "state.json"
+    writer = SegmentWriter(inputs)
+    segment = writer.append("A", "Makkah", "15/08/2025", "16/08/2025", _rows(1))
+    (inputs / "notes.txt").write_text("ignored", encoding="utf-8")
+
+    processed = ProcessedLog(state, fingerprint="v1")
+    pending = processed.pending(inputs)
+    assert list(pending) == [segment.name]
+    processed.mark(pending)
+    processed.save()
+
+    processed = ProcessedLog(state, fingerprint="v1")
+    assert processed.pending(inputs) == {}
+    writer.append("A", "Makkah", "16/08/2025", "17/08/2025", _rows(1))  # the segment grows
+    assert list(processed.pending(inputs)) == [segment.name]
+
+    assert list(ProcessedLog(state, fingerprint="v2").pending(inputs)) == [segment.name]
+    assert list(ProcessedLog(state, fingerprint="v1", reset=True).pending(inputs)) == [segment.name]
+
+
+def test_processed_log_survives_a_corrupt_state_file(tmp_path):
+    state, inputs = tmp_path / "state.json", tmp_path / "in"
+    state.write_text("{not json", encoding="utf-8")
+    inputs.mkdir()
+    (inputs / "a.json").write_text("[]", encoding="utf-8")
+    assert list(ProcessedLog(state).pending(inputs)) == ["a.json"]
+
+
+def test_write_atomic_replaces_whole_file(tmp_path):
+    target = tmp_path / "sub" / "out.json"
+    raw_store.write_json_atomic(target, {"a": 1})
+    raw_store.write_json_atomic(target, {"a": 2})
+    assert json.loads(target.read_text(encoding="utf-8")) == {"a": 2}
+    assert [p.name for p in target.parent.iterdir()] == ["out.json"]
+
+
+def test_migrate_legacy_files(tmp_path):
+    (tmp_path / "Emaar_Legend_15-08-2025.json").write_text(json.dumps(_rows(2)), encoding="utf-8")
+    assert raw_store.migrate_legacy_files(tmp_path, delete=True) == 1
+    assert not list(tmp_path.glob("*.json"))
+    (job,) = iter_segment_jobs(tmp_path)
+    assert (job["checkin"], job["checkout"], len(job["rows"])) == ("15/08/2025", "16/08/2025", 2)
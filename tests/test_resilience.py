@@ -0,0 +1,56 @@
+# test_resilience.py
+"""
+CircuitBreaker state transitions, driven by a fake clock.
+
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+from resilience import CircuitBreaker, ERROR, NOT_FOUND, OK, SESSION_EXPIRED, TIMEOUT
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _half_open(clock: Clock) -> CircuitBreaker:
+    breaker = CircuitBreaker(threshold=2, cooldown=10, clock=clock)
+    breaker.record(TIMEOUT)
+    breaker.record(TIMEOUT)
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.remaining() == 0
+    breaker._transition("half_open")  # what wait() does once the cooldown is over
+    return breaker
+
+
+def test_opens_after_threshold_and_errors_do_not_reset():
+    breaker = CircuitBreaker(threshold=3, clock=Clock())
+    for outcome in (TIMEOUT, ERROR, TIMEOUT, SESSION_EXPIRED):
+        breaker.record(outcome)
+    assert breaker.state == "closed" and breaker.failures == 2
+    breaker.record(TIMEOUT)
+    assert breaker.state == "open"
+
+
+def test_failed_probe_reopens_with_longer_cooldown():
+    clock = Clock()
+    breaker = _half_open(clock)
+    breaker.record(TIMEOUT)
+    assert breaker.state == "open" and breaker.cooldown == 20
+
+
+def test_any_site_answer_resolves_the_probe():
+    for outcome in (OK, NOT_FOUND, SESSION_EXPIRED, ERROR):
+        breaker = _half_open(Clock())
+        breaker.record(outcome)
+        assert breaker.state == "closed", outcome
+        assert breaker.failures == 0 and breaker.cooldown == 10
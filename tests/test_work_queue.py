@@ -0,0 +1,116 @@
+# test_work_queue.py
+"""
+WorkQueue leases: expiry, renewal, exhaustion, lost leases and release().
+
+    python -m pytest -q tests
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # local import
+
+import work_queue
+from work_queue import WorkQueue
+
+JOBS = [("Makkah", "A", "15/08/2025", "16/08/2025"), ("Makkah", "B", "15/08/2025", "16/08/2025")]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(work_queue, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    q = WorkQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=60, max_attempts=2)
+    yield q
+    q.close()
+
+
+def _row(queue, job_id):
+    return queue._conn.execute("SELECT status, worker, attempts, last_error FROM jobs WHERE id=?",
+                               (job_id,)).fetchone()
+
+
+def test_enqueue_skips_duplicates_and_reset_reopens(queue):
+    assert queue.enqueue(JOBS) == 2
+    assert queue.enqueue(JOBS) == 0
+    job_id, _ = queue.lease("w1")
+    queue.complete(job_id, "w1")
+    queue.enqueue(JOBS, reset=True)
+    assert queue.stats()["pending"] == 2 and _row(queue, job_id)[2] == 0
+
+
+def test_each_job_is_leased_once_until_it_expires(queue, clock):
+    queue.enqueue(JOBS[:1])
+    job_id, job = queue.lease("w1")
+    assert job == JOBS[0]
+    assert queue.lease("w2") is None
+    clock.now += 61
+    assert queue.lease("w2")[0] == job_id
+    assert _row(queue, job_id)[:3] == ("leased", "w2", 2)
+
+
+def test_renew_keeps_the_lease(queue, clock):
+    queue.enqueue(JOBS[:1])
+    job_id, _ = queue.lease("w1")
+    clock.now += 50
+    assert queue.renew(job_id, "w1")
+    clock.now += 50  # 100s after leasing, 50s after renewing
+    assert queue.lease("w2") is None
+    assert not queue.renew(job_id, "w2")
+
+
+def test_expired_lease_out_of_attempts_is_failed_not_reissued(queue, clock):
+    queue.enqueue(JOBS[:1])
+    job_id, _ = queue.lease("w1")
+    clock.now += 61
+    queue.lease("w2")
+    clock.now += 61
+    assert queue.lease("w3") is None
+    status, _, attempts, error = _row(queue, job_id)
+    assert (status, attempts) == ("failed", 2) and "lease expired" in error
+
+
+def test_lost_lease_is_reported(queue, clock):
+    queue.enqueue(JOBS[:1])
+    job_id, _ = queue.lease("w1")
+    clock.now += 61
+    queue.lease("w2")
+    assert not queue.complete(job_id, "w1")
+    assert not queue.fail(job_id, "w1", "timeout")
+    assert not queue.release(job_id, "w1")
+    assert queue.complete(job_id, "w2")
+    assert _row(queue, job_id)[0] == "done"
+
+
+def test_fail_retries_until_max_attempts(queue):
+    queue.enqueue(JOBS[:1])
+    job_id, _ = queue.lease("w1")
+    assert queue.fail(job_id, "w1", "timeout")
+    assert _row(queue, job_id)[0] == "pending"
+    queue.lease("w1")
+    assert queue.fail(job_id, "w1", "timeout")
+    assert _row(queue, job_id)[0] == "failed"
+
+
+def test_release_refunds_the_attempt(queue):
+    queue.enqueue(JOBS[:1])
+    for _ in range(5):
+        job_id, _ = queue.lease("w1")
+        assert queue.release(job_id, "w1")
+    assert _row(queue, job_id)[:3] == ("pending", None, 0)
@@ -0,0 +1,174 @@
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from raw_store import write_atomic, write_json_atomic
+from save_nested import _as_date, _room_doc_id, _slug
+from utils.metrics import PRICE_ANOMALIES
+
+# Thresholds; prices are in SAR per night
+WINDOW = 15            # observations per rolling window, centred on the row
+MIN_PERIODS = 3        # fewer known prices than this: no median, no z-score
+Z_THRESHOLD = 5.0      # |robust z| above this is an outlier on its own
+Z_SOFT = 3.0           # a day-over-day jump also needs |z| above this (when a z exists)
+JUMP_RATIO = 3.0       # price vs the previous known price of the same series, either way
+MIN_PRICE = 10.0       # plausible prices are MIN_PRICE..MAX_PRICE, both inclusive
+MAX_PRICE = 100_000.0
+REL_FLOOR = 0.15       # MAD scale never below 15% of the median: rate plans of one room differ that much
+
+QUARANTINE_INDEX = "quarantined.json"  # in the quarantine directory: fingerprints of rows held back
+
+
+def _rolling(values: np.ndarray, group: np.ndarray, fn: str) -> np.ndarray:
+    """
+    Centred rolling median/etc. of `values`, sorted by `group`, without crossing
+    groups: half a window of NaN is inserted between groups (rolling skips NaN), so
+    one pass over the whole sweep replaces a groupby-rolling per series.
+    """
+    pad = WINDOW // 2
+    starts = np.r_[True, group[1:] != group[:-1]]
+    pos = np.arange(len(values)) + np.cumsum(starts) * pad
+    padded = np.full(len(values) + (starts.sum() + 1) * pad, np.nan)
+    padded[pos] = values
+    rolled = getattr(pd.Series(padded).rolling(WINDOW, center=True, min_periods=MIN_PERIODS), fn)()
+    return rolled.to_numpy()[pos]
+
+
+def _series_codes(rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (series code, date ordinal) per row. A series is one Rooms/<id> doc of one hotel:
+    (city slug, hotel slug, room doc id), the same identity save_nested writes to.
+    Slugs and date parsing run on the distinct values only.
+    """
+    raw_keys = [f"{r['city']}\x1f{r['hotel']}\x1f{r['room_name']}\x1f{r.get('meal_plan') or ''}" for r in rows]
+    codes, uniques = pd.factorize(np.array(raw_keys, dtype=object))
+    canonical = []
+    for key in uniques:
+        city, hotel, room, meal = key.split("\x1f")
+        canonical.append(f"{_slug(city.strip())}/{_slug(hotel.strip())}/{_room_doc_id(room, meal)}")
+    series = pd.factorize(np.array(canonical, dtype=object))[0][codes] if len(uniques) else codes
+
+    date_codes, date_uniques = pd.factorize(np.array([str(r["date"]) for r in rows], dtype=object))
+    ordinals = np.array([_as_date(d).toordinal() for d in date_uniques], dtype=np.int64)
+    return series, ordinals[date_codes] if len(date_uniques) else date_codes
+
+
+def screen_prices(rows: List[Dict[str, Any]], history: List[Dict[str, Any]] = ()) -> pd.DataFrame:
+    """
+    One vectorised pass over a sweep plus already-stored history (both in the
+    save_cleaned_rows_nested shape). A series is one room/meal of one hotel ordered by
+    date; for history and sweep prices of the same date, history comes first. Per sweep row:
+
+      median, z      robust z-score against the rolling median / MAD of the series
+      prev_price     the previous known price of the series (an earlier date, or an
+                     earlier scrape of the same date)
+      reasons        '' or a comma list of missing_price, out_of_bounds, robust_z, jump
+
+    A row without a price (an 'N/A' or unparsable cell that became None) is flagged
+    missing_price; such rows never count as history.
+    Returned frame is aligned with `rows` (same order and length).
+    """
+    history = list(history)
+    combined = history + list(rows)
+    in_sweep = np.r_[np.zeros(len(history), bool), np.ones(len(rows), bool)]
+    series, date = _series_codes(combined)
+    order = np.lexsort((in_sweep, date, series))
+
+    price = np.array([r.get("price") for r in combined], dtype=float)[order]
+    group = series[order]
+    sweep_row = in_sweep[order]
+
+    # reference statistics only use plausible prices
+    priced = np.isfinite(price)
+    known = priced & (price >= MIN_PRICE) & (price <= MAX_PRICE)
+    kp, kg = price[known], group[known]
+    median = np.full(len(price), np.nan)
+    scale = np.full(len(price), np.nan)
+    prev = np.full(len(price), np.nan)
+    if len(kp):
+        med = _rolling(kp, kg, "median")
+        mad = _rolling(np.abs(kp - med), kg, "median")
+        median[known] = med
+        scale[known] = np.maximum(1.4826 * mad, REL_FLOOR * med)
+        prev[known] = np.where(np.r_[False, kg[1:] == kg[:-1]], np.r_[np.nan, kp[:-1]], np.nan)
+    z = (price - median) / scale
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = price / prev
+        bounds = priced & ~known
+        robust = np.abs(z) > Z_THRESHOLD
+        jump = ((ratio >= JUMP_RATIO) | (ratio <= 1 / JUMP_RATIO)) & (np.isnan(z) | (np.abs(z) > Z_SOFT))
+
+    reasons = np.full(len(price), "", dtype=object)
+    for name, mask in (("missing_price", ~priced), ("out_of_bounds", bounds), ("robust_z", robust), ("jump", jump)):
+        reasons[mask] = np.where(reasons[mask] == "", name, reasons[mask] + "," + name)
+
+    # back to the caller's row order, sweep rows only
+    row = order[sweep_row] - len(history)
+    report = pd.DataFrame({
+        "price": price, "median": median, "z": z, "prev_price": prev, "reasons": reasons,
+    })[sweep_row]
+    report.index = row
+    return report.sort_index()
+
+
+def split_rows(rows: List[Dict[str, Any]], report: pd.DataFrame) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(rows to save, flagged rows with an 'anomaly' block explaining why)."""
+    flagged_idx = np.flatnonzero(report["reasons"].to_numpy() != "")
+    flagged_set = set(flagged_idx.tolist())
+    keep = [r for i, r in enumerate(rows) if i not in flagged_set]
+    flagged = []
+    for i in flagged_idx:
+        stats = report.iloc[i]
+        for reason in stats["reasons"].split(","):
+            PRICE_ANOMALIES.inc(reason=reason)
+        flagged.append({**rows[i], "anomaly": {
+            "reasons": stats["reasons"].split(","),
+            "median": None if np.isnan(stats["median"]) else round(float(stats["median"]), 2),
+            "z": None if np.isnan(stats["z"]) else round(float(stats["z"]), 2),
+            "prev_price": None if np.isnan(stats["prev_price"]) else float(stats["prev_price"]),
+        }})
+    return keep, flagged
+
+
+def row_fingerprint(row: Dict[str, Any]) -> str:
+    """Identity of one scraped price: the room doc, the price and when it was scraped."""
+    return json.dumps([row.get("city"), row.get("hotel"), str(row.get("date")), row.get("room_name"),
+                       row.get("meal_plan") or "", row.get("price"), str(row.get("scraped_at") or "")],
+                      ensure_ascii=False, default=str)
+
+
+def quarantined(directory) -> Set[str]:
+    """Fingerprints of the rows already written to quarantine (see quarantine_rows)."""
+    try:
+        with open(Path(directory) / QUARANTINE_INDEX, "r", encoding="utf-8") as f:
+            return set(json.load(f))
+    except (OSError, ValueError, TypeError):
+        return set()
+
+
+def quarantine_rows(flagged: List[Dict[str, Any]], directory) -> Optional[Path]:
+    """
+    Write flagged rows not quarantined before to <directory>/quarantine-<utc>.jsonl and
+    add them to the directory's index; None when every row was already there. Flagged
+    rows stay in cleaned_data, so each run meets them again.
+    """
+    directory = Path(directory)
+    seen = quarantined(directory)
+    fresh = {}
+    for row in flagged:
+        fresh.setdefault(row_fingerprint(row), row)
+    fresh = {k: row for k, row in fresh.items() if k not in seen}
+    if not fresh:
+        return None
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    path = directory / f"quarantine-{stamp}-{os.getpid()}.jsonl"
+    lines = "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in fresh.values())
+    write_atomic(path, lines.encode("utf-8"))
+    write_json_atomic(directory / QUARANTINE_INDEX, sorted(seen | set(fresh)), fsync=True)
+    return path
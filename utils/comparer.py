@@ -1,13 +1,139 @@
-def compare_prices(myhotels, nozolinn):
-    alerts = []
-    for room in myhotels:
-        match = next((r for r in nozolinn if r["hotel"] == room["hotel"] and r["room"] == room["room"]), None)
-        if match:
-            if match["price"] > room["price"]:
-                alerts.append({
-                    "hotel": room["hotel"],
-                    "room": room["room"],
-                    "myhotels_price": room["price"],
-                    "nozolinn_price": match["price"]
-                })
-    return alerts
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+KEYS = ["hotel", "room", "meal", "date"]
+
+
+def _on_uniques(series: pd.Series, fn) -> pd.Series:
+    """Apply a vectorised string transform to the distinct values only, then broadcast back."""
+    codes, uniques = pd.factorize(series.fillna("").astype(str), sort=False)
+    return pd.Series(fn(pd.Series(uniques)).to_numpy()[codes], index=series.index)
+
+
+def _norm(series: pd.Series) -> pd.Series:
+    return _on_uniques(series, lambda s: (s.str.replace("–", "-", regex=False)
+                                           .str.replace(r"\s+", " ", regex=True)
+                                           .str.strip().str.lower()))
+
+
+def _parse_dates(raw: pd.Series) -> pd.Series:
+    raw = raw.str.strip()
+    parsed = pd.to_datetime(raw, format="%Y-%m-%d", errors="coerce")
+    for fmt in ("%d/%m/%Y", "%d-%m-%Y"):
+        parsed = parsed.fillna(pd.to_datetime(raw, format=fmt, errors="coerce"))
+    return parsed.dt.strftime("%Y-%m-%d").fillna(raw)
+
+
+def _norm_dates(series: pd.Series) -> pd.Series:
+    """'YYYY-MM-DD', 'DD/MM/YYYY' or 'DD-MM-YYYY' → 'YYYY-MM-DD'; missing dates stay ''."""
+    return _on_uniques(series, _parse_dates)
+
+
+def _norm_prices(series: pd.Series) -> pd.Series:
+    """Numbers pass straight through; strings like 'SAR 1,234.50' go through a regex once per distinct value."""
+    numeric = pd.to_numeric(series, errors="coerce")
+    text = series.notna() & numeric.isna()
+    if text.any():
+        numeric[text] = pd.to_numeric(
+            _on_uniques(series[text], lambda s: s.str.replace(",", "", regex=False).str.extract(r"(-?\d+\.?\d*)")[0]),
+            errors="coerce",
+        )
+    return numeric.astype(float)
+
+
+def to_price_frame(rows: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Build a keyed price frame from raw scraper rows, cleaned rows or the
+    save_cleaned_rows_nested payload. Columns: hotel, room, meal, date, price.
+    """
+    df = pd.DataFrame(list(rows))
+    if df.empty:
+        return pd.DataFrame(columns=KEYS + ["price"])
+
+    def pick(*cols):
+        out = pd.Series([None] * len(df), index=df.index, dtype=object)
+        for c in cols:
+            if c in df:
+                out = out.where(out.notna(), df[c])
+        return out
+
+    frame = pd.DataFrame({
+        "hotel": _norm(pick("hotel", "H")),
+        "room": _norm(pick("room", "room_name", "normalized_room_type", "R")),
+        "meal": _norm(pick("meal", "meal_plan", "normalized_meal", "M")),
+        "date": _norm_dates(pick("date", "checkin", "D")),
+        "price": _norm_prices(pick("price", "P")),
+    })
+    return frame
+
+
+def compare_price_frames(myhotels: pd.DataFrame, nozolinn: pd.DataFrame, how: str = "min") -> pd.DataFrame:
+    """
+    Hash-join both sides on (hotel, room, meal, date) and compute the gaps in one pass.
+    `how` collapses duplicate keys on each side: "min" keeps the cheapest offer,
+    "first" keeps the first row (the old compare_prices behaviour for nozolinn).
+    gap = nozolinn_price - myhotels_price; pct_gap is relative to myhotels_price.
+    """
+    mine = myhotels.dropna(subset=["price"])
+    theirs = nozolinn.dropna(subset=["price"])
+    if how == "min":
+        mine = mine.groupby(KEYS, as_index=False, sort=False)["price"].min()
+        theirs = theirs.groupby(KEYS, as_index=False, sort=False)["price"].min()
+    elif how == "first":
+        theirs = theirs.drop_duplicates(subset=KEYS, keep="first")
+    else:
+        raise ValueError(f"Unknown how: {how}")
+
+    merged = mine.merge(theirs, on=KEYS, how="inner", suffixes=("_myhotels", "_nozolinn"), sort=False)
+    merged = merged.rename(columns={"price_myhotels": "myhotels_price", "price_nozolinn": "nozolinn_price"})
+
+    mine_p = merged["myhotels_price"].to_numpy(dtype=float)
+    theirs_p = merged["nozolinn_price"].to_numpy(dtype=float)
+    gap = theirs_p - mine_p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(mine_p != 0, gap / mine_p * 100.0, np.nan)
+    merged["gap"] = gap
+    merged["pct_gap"] = pct
+    return merged
+
+
+def undercuts(comparison: pd.DataFrame, min_abs_gap: float = 0.0, min_pct_gap: float = 0.0) -> pd.DataFrame:
+    """Rows where myhotels is cheaper than nozolinn by more than both thresholds."""
+    gap = comparison["gap"].to_numpy()
+    pct = comparison["pct_gap"].fillna(np.inf).to_numpy()
+    mask = (gap > 0) & (gap >= min_abs_gap) & (pct >= min_pct_gap)
+    return comparison[mask]
+
+
+def top_undercuts(comparison: pd.DataFrame, n: int = 10, by: str = "pct_gap",
+                  min_abs_gap: float = 0.0, min_pct_gap: float = 0.0) -> pd.DataFrame:
+    return undercuts(comparison, min_abs_gap, min_pct_gap).nlargest(n, by)
+
+
+def compare_prices(myhotels, nozolinn) -> List[Dict[str, Any]]:
+    """
+    Alert for every myhotels room that nozolinn sells at a higher price, with the
+    normalised meal and 'YYYY-MM-DD' date of the match (None when the rows had none),
+    so AlertDispatcher can tell one room's dates and meal plans apart.
+    """
+    originals = list(myhotels)
+    mine = to_price_frame(originals)
+    mine["_order"] = np.arange(len(mine))
+    theirs = to_price_frame(nozolinn)
+    comparison = compare_price_frames(mine, theirs, how="first").sort_values("_order", kind="stable")
+    hits = undercuts(comparison)
+
+    return [
+        {
+            "hotel": originals[i]["hotel"],
+            "room": originals[i]["room"],
+            "meal": meal or None,
+            "date": date or None,
+            "myhotels_price": originals[i]["price"],
+            "nozolinn_price": price,
+        }
+        for i, meal, date, price in zip(hits["_order"].tolist(), hits["meal"].tolist(),
+                                        hits["date"].tolist(), hits["nozolinn_price"].tolist())
+    ]
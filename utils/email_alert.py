@@ -1,17 +1,315 @@
+import asyncio
+import json
+import logging
 import smtplib
+import time
 from email.message import EmailMessage
 import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
+from utils.metrics import get_logger, log_event
 
 load_dotenv()
+log = get_logger("alerts")
 
-def send_email(subject, content):
+def _build_message(subject, content, sender=None, to=None):
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = os.getenv("EMAIL_USER")
-    msg["To"] = os.getenv("EMAIL_TO")
+    msg["From"] = sender or os.getenv("EMAIL_USER")
+    msg["To"] = to or os.getenv("EMAIL_TO")
     msg.set_content(content)
+    return msg
+
+def send_email(subject, content):
+    msg = _build_message(subject, content)
 
     with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
         smtp.login(os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASS"))
         smtp.send_message(msg)
+
+
+class AlertDispatcher:
+    """
+    Queue price alerts during a sweep and send them as digests over one reused SMTP connection.
+
+        async with AlertDispatcher(group_by="hotel") as alerts:
+            for a in compare_prices(myhotels, nozolinn):
+                await alerts.enqueue(a)
+        # leaving the block flushes the last digest and closes the connection
+
+    - digests: everything queued within `window_seconds` (or until flush()) goes out as
+      one email, or one email per hotel with group_by="hotel"
+    Alerts are dicts with hotel, room, meal, date, myhotels_price and nozolinn_price, as
+    compare_prices() returns them (or rows of comparer.undercuts()).
+    - dedup: an alert for the same hotel/room/meal/date is not re-sent until `cooldown_seconds`
+      have passed, whatever the prices; the sent log is kept in `state_path` so it
+      survives between sweeps
+    - retry: failed sends reconnect and retry with exponential backoff; a digest that
+      still fails goes back on the pending list and is tried again after
+      `requeue_seconds` (doubling per consecutive failure, up to `max_requeue_seconds`)
+    Point host/port at a local stand-in (e.g. aiosmtpd) with use_ssl=False and no
+    username to exercise it without Gmail.
+    """
+
+    def __init__(self,
+                 host: str = "smtp.gmail.com",
+                 port: int = 465,
+                 use_ssl: bool = True,
+                 username: Optional[str] = None,
+                 password: Optional[str] = None,
+                 sender: Optional[str] = None,
+                 to: Optional[str] = None,
+                 group_by: str = "sweep",
+                 window_seconds: float = 300.0,
+                 cooldown_seconds: float = 6 * 3600,
+                 max_retries: int = 3,
+                 retry_backoff: float = 1.0,
+                 requeue_seconds: float = 60.0,
+                 max_requeue_seconds: float = 1800.0,
+                 state_path: Optional[str] = "alert_state.json"):
+        if group_by not in ("sweep", "hotel"):
+            raise ValueError(f"Unknown group_by: {group_by}")
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username if username is not None else os.getenv("EMAIL_USER")
+        self.password = password if password is not None else os.getenv("EMAIL_PASS")
+        self.sender = sender or os.getenv("EMAIL_USER")
+        self.to = to or os.getenv("EMAIL_TO")
+        self.group_by = group_by
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.requeue_seconds = requeue_seconds
+        self.max_requeue_seconds = max_requeue_seconds
+        self.state_path = Path(state_path) if state_path else None
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_keys = set()
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._send_failures = 0  # consecutive digests that exhausted their retries
+        self._sent_at: Dict[str, float] = self._load_state()
+        self.stats = {"queued": 0, "deduped": 0, "emails": 0, "retries": 0, "failed": 0,
+                      "requeued": 0, "unsent": 0}
+
+    # ---------- lifecycle ----------
+    async def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker is not None:
+            try:
+                await self.flush()
+            except RuntimeError as e:
+                log_event(log, "alert_worker_failed", logging.ERROR, error=str(e.__cause__ or e))
+            self._worker.cancel()
+            try:
+                await self._worker
+            except BaseException:
+                pass  # cancelled, or the failure logged above
+            self._worker = None
+        if self._pending:
+            # still failing after the last flush: nothing left to retry them
+            self.stats["unsent"] += len(self._pending)
+            log_event(log, "alerts_unsent", logging.ERROR, alerts=len(self._pending))
+            self._pending, self._pending_keys = [], set()
+        await asyncio.to_thread(self._disconnect)
+        self._save_state()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- public API ----------
+    async def enqueue(self, alert: Dict[str, Any]):
+        await self._queue.put(alert)
+
+    async def flush(self):
+        """
+        Send everything queued so far without waiting for the window to close. Digests
+        that fail stay pending for a later retry. Raises RuntimeError if the worker is
+        not running (never started, or died) instead of waiting forever.
+        """
+        self._check_worker()
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put(done)
+        await asyncio.wait({done, self._worker}, return_when=asyncio.FIRST_COMPLETED)
+        if not done.done():
+            self._check_worker()
+
+    def _check_worker(self):
+        if self._worker is None:
+            raise RuntimeError("AlertDispatcher is not started")
+        if self._worker.done():
+            error = None if self._worker.cancelled() else self._worker.exception()
+            raise RuntimeError("AlertDispatcher worker stopped") from error
+
+    # ---------- worker ----------
+    async def _run(self):
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self._send_pending()
+                deadline = self._requeue_deadline()
+                continue
+
+            if isinstance(item, asyncio.Future):
+                await self._send_pending()
+                deadline = self._requeue_deadline()
+                if not item.done():
+                    item.set_result(None)
+                continue
+
+            self.stats["queued"] += 1
+            key = self._alert_key(item)
+            sent_at = self._sent_at.get(key)
+            if sent_at is not None and time.time() - sent_at < self.cooldown_seconds:
+                self.stats["deduped"] += 1
+                continue
+            if key in self._pending_keys:
+                self.stats["deduped"] += 1
+                continue
+
+            self._pending.append(item)
+            self._pending_keys.add(key)
+            if deadline is None:
+                deadline = time.monotonic() + self.window_seconds
+
+    async def _send_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._pending_keys = set()
+
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for alert in pending:
+            group = alert.get("hotel", "") if self.group_by == "hotel" else ""
+            groups.setdefault(group, []).append(alert)
+
+        failed: List[Dict[str, Any]] = []
+        for group, alerts in groups.items():
+            subject = f"Price alerts: {len(alerts)} room(s)" + (f" at {group}" if group else "")
+            msg = _build_message(subject, self._format_digest(alerts), self.sender, self.to)
+            if await self._send_with_retry(msg):
+                now = time.time()
+                for alert in alerts:
+                    self._sent_at[self._alert_key(alert)] = now
+            else:
+                failed.extend(alerts)
+
+        if failed:
+            # back in front of anything queued meanwhile; newer alerts for the same key are deduped
+            self._send_failures += 1
+            self.stats["requeued"] += len(failed)
+            self._pending = failed + self._pending
+            self._pending_keys.update(self._alert_key(a) for a in failed)
+            log_event(log, "alerts_requeued", logging.WARNING, alerts=len(failed),
+                      retry_in_s=round(self._requeue_delay(), 1))
+        else:
+            self._send_failures = 0
+        self._save_state()
+
+    def _requeue_delay(self) -> float:
+        return min(self.max_requeue_seconds, self.requeue_seconds * 2 ** max(0, self._send_failures - 1))
+
+    def _requeue_deadline(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        delay = self._requeue_delay() if self._send_failures else self.window_seconds
+        return time.monotonic() + delay
+
+    async def _send_with_retry(self, msg: EmailMessage) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._send, msg)
+                self.stats["emails"] += 1
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                await asyncio.to_thread(self._disconnect)
+                if attempt == self.max_retries:
+                    log_event(log, "alert_email_failed", logging.ERROR, attempts=attempt + 1, error=str(e))
+                    self.stats["failed"] += 1
+                    return False
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        return False
+
+    # ---------- SMTP (blocking, runs in a thread) ----------
+    def _connect(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _send(self, msg: EmailMessage):
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        self._smtp.send_message(msg)
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _alert_key(alert: Dict[str, Any]) -> str:
+        # prices move between sweeps; the same room and meal on the same date is still the same
+        # alert, while RO and BB undercuts of one room are two
+        return json.dumps([alert.get("hotel"), alert.get("room"), alert.get("meal"), alert.get("date")],
+                          default=str)
+
+    @staticmethod
+    def _format_digest(alerts: List[Dict[str, Any]]) -> str:
+        lines = []
+        for a in alerts:
+            meal = f" ({a['meal']})" if a.get("meal") else ""
+            when = f" on {a['date']}" if a.get("date") else ""
+            lines.append(
+                f"- {a.get('hotel')} / {a.get('room')}{meal}{when}: "
+                f"myhotels {a.get('myhotels_price')} vs nozolinn {a.get('nozolinn_price')}"
+            )
+        return "\n".join(lines)
+
+    def _load_state(self) -> Dict[str, float]:
+        if not (self.state_path and self.state_path.exists()):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return {str(k): float(t) for k, t in state.items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # a torn or hand-edited file only costs the cooldown history
+            log_event(log, "alert_state_unreadable", logging.WARNING, path=str(self.state_path), error=str(e))
+            return {}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        now = time.time()
+        live = {k: t for k, t in self._sent_at.items() if now - t < self.cooldown_seconds}
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(live, f, ensure_ascii=False, indent=2)
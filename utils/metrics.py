@@ -0,0 +1,274 @@
+"""
+Shared instrumentation: structured JSON logs plus in-process counters/histograms
+rendered in Prometheus text format.
+
+    from utils.metrics import get_logger, log_event, SCRAPE_STEP_SECONDS
+
+    log = get_logger("scraper")
+    with SCRAPE_STEP_SECONDS.time(step="open_search"):
+        ...
+    log_event(log, "rows_extracted", hotel=hotel_name, rows=len(extracted))
+
+Counters live in the process that increments them, so each process type exposes
+its own:
+- `python main.py` (the scraper and pipeline) serves them with start_metrics_server()
+  on METRICS_PORT (default 9108) at /metrics
+- short-lived processes (the clean_with_openai.py subprocess, --workers browser
+  processes) call write_textfile(), which drops <name>.prom into METRICS_DIR
+- both the scraper's server and the API's /metrics (uvicorn main:app) merge in every
+  METRICS_DIR/*.prom file, adding a process="<name>" label to its samples
+
+Scrape the scraper host on :9108 for the pipeline; the API's /metrics only carries
+the API's own metrics plus whatever textfiles are on its host.
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ============== Structured logging ==============
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+def get_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+# ============== Metrics ==============
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(key)} {v}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0.0
+
+    def total(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[-2] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', repr(float(bound))))} {n}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {series[-1]}")
+        return lines
+
+_REGISTRY: Dict[str, object] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def counter(name: str, help_text: str) -> Counter:
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(name, Counter(name, help_text))
+
+def gauge(name: str, help_text: str) -> Gauge:
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(name, Gauge(name, help_text))
+
+def histogram(name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(name, Histogram(name, help_text, buckets))
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", str(Path(__file__).resolve().parent.parent / "metrics")))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+def _merge_family(families: Dict[str, List[str]], lines: Iterable[str], process: Optional[str] = None):
+    """Fold rendered lines into {family: [HELP, TYPE, samples...]}, one header per family."""
+    name = None
+    for line in lines:
+        if not line.strip():
+            continue
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            name = line.split(" ", 3)[2]
+            family = families.setdefault(name, [None, None])
+            slot = 0 if line.startswith("# HELP ") else 1
+            if family[slot] is None:
+                family[slot] = line
+            continue
+        if line.startswith("#") or name is None:
+            continue
+        if process is not None:
+            label = f'process="{_escape(process)}"'
+            sample, value = line.rsplit(" ", 1)
+            sample = sample.replace("{", "{" + label + ",", 1) if "{" in sample else sample + "{" + label + "}"
+            line = f"{sample} {value}"
+        families[name].append(line)
+
+def render_prometheus(textfile_dir: Optional[Path] = None) -> str:
+    """This process's metrics, plus the *.prom files other processes left in `textfile_dir`."""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    families: Dict[str, List[str]] = {}
+    for m in metrics:
+        _merge_family(families, m.render())
+    if textfile_dir is not None and Path(textfile_dir).is_dir():
+        for fp in sorted(Path(textfile_dir).glob("*.prom")):
+            try:
+                _merge_family(families, fp.read_text(encoding="utf-8").splitlines(), process=fp.stem)
+            except OSError:
+                continue  # replaced while reading; next scrape picks it up
+    lines: List[str] = []
+    for family in families.values():
+        lines.extend(line for line in family if line is not None)
+    return "\n".join(lines) + "\n"
+
+def write_textfile(name: str, directory: Optional[Path] = None) -> Path:
+    """Atomically write this process's metrics to <directory>/<name>.prom (default METRICS_DIR)."""
+    directory = Path(directory or METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.prom"
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0",
+                         textfile_dir: Optional[Path] = METRICS_DIR) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread (for processes that aren't the FastAPI app)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(textfile_dir).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would drown the JSON logs
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+# ============== Pipeline metrics ==============
+# scraper (main.search_city_hotel, resilience, browser_session)
+SCRAPE_STEP_SECONDS = histogram("scrape_step_seconds", "Time spent in each search_city_hotel step")
+SCRAPE_JOBS = counter("scrape_jobs_total", "Scrape jobs by outcome")
+ROWS_EXTRACTED = counter("scrape_rows_extracted_total", "Room rows extracted from hotel pages")
+STEP_RETRIES = counter("scrape_step_retries_total", "Scrape step retries after a timeout or network error")
+CIRCUIT_TRANSITIONS = counter("scrape_circuit_transitions_total", "Circuit breaker state changes by new state")
+BROWSER_TABS = gauge("browser_open_tabs", "Open tabs in the scraping browser context (last sample)")
+BROWSER_MEMORY_MB = gauge("browser_memory_mb", "Browser memory at the last sample, by source (uss, js_heap)")
+CONTEXT_RECYCLES = counter("browser_context_recycles_total", "Browser contexts replaced, by reason")
+
+# cleaner (clean_with_openai)
+CLASSIFICATIONS = counter("classifications_total", "Room classifications by source (cached, local, gpt, gpt_error) plus discarded/flagged rows")
+GPT_SECONDS = histogram("gpt_classify_seconds", "OpenAI classification latency")
+
+# price screening (utils.anomalies)
+PRICE_ANOMALIES = counter("price_anomalies_total", "Scraped prices quarantined before saving, by reason")
+
+# writer (save_nested)
+FIRESTORE_WRITES = counter("firestore_writes_total", "Firestore set() operations by kind")
+BATCH_COMMIT_SECONDS = histogram("firestore_batch_commit_seconds", "Firestore batch commit latency")
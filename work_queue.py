@@ -0,0 +1,136 @@
+# work_queue.py
+"""
+Shared local job queue for sharded scraping (main.py --workers N).
+
+Jobs are (city, hotel, checkin, checkout) rows in a SQLite file. A worker leases one
+job at a time and renew()s the lease while the job runs; a lease that is neither
+completed nor renewed within `lease_seconds` (worker crashed or hung) is handed to the
+next worker that asks. Failed and expired jobs go back to 'pending' until they reach
+`max_attempts`, then stay 'failed' — so a job that keeps crashing its worker stops.
+
+complete(), fail() and renew() only act while the caller still holds the lease and
+return False otherwise (the lease expired and another worker took the job). release()
+hands a job back without spending an attempt, for a worker that can't run anything
+(signed out) rather than one the job failed on.
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+Job = Tuple[str, str, str, str]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    city        TEXT NOT NULL,
+    hotel       TEXT NOT NULL,
+    checkin     TEXT NOT NULL,
+    checkout    TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',   -- pending | leased | done | failed
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    UNIQUE (city, hotel, checkin, checkout)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+"""
+
+class WorkQueue:
+    def __init__(self, path: str = "work_queue.sqlite3", lease_seconds: float = 300.0, max_attempts: int = 2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    @contextmanager
+    def _tx(self):
+        # IMMEDIATE takes the write lock up front so two workers never lease the same job
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def enqueue(self, jobs: Iterable[Job], reset: bool = False) -> int:
+        """Add jobs, skipping ones already queued; reset=True re-opens done/failed ones."""
+        added = 0
+        with self._tx():
+            for city, hotel, checkin, checkout in jobs:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (city, hotel, checkin, checkout) VALUES (?, ?, ?, ?)",
+                    (city, hotel, checkin, checkout))
+                if cur.rowcount:
+                    added += 1
+                elif reset:
+                    self._conn.execute(
+                        "UPDATE jobs SET status='pending', attempts=0, worker=NULL, lease_until=NULL "
+                        "WHERE city=? AND hotel=? AND checkin=? AND checkout=?",
+                        (city, hotel, checkin, checkout))
+        return added
+
+    def lease(self, worker: str) -> Optional[Tuple[int, Job]]:
+        """Claim the next pending (or expired) job for `worker`; None when nothing is left."""
+        now = time.time()
+        with self._tx():
+            # expired leases that used up their attempts are not handed out again
+            self._conn.execute(
+                "UPDATE jobs SET status='failed', lease_until=NULL, "
+                "last_error='lease expired after ' || attempts || ' attempt(s)' "
+                "WHERE status='leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts))
+            row = self._conn.execute(
+                "SELECT id, city, hotel, checkin, checkout FROM jobs "
+                "WHERE status='pending' OR (status='leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status='leased', worker=?, lease_until=?, attempts=attempts+1 WHERE id=?",
+                (worker, now + self.lease_seconds, row[0]))
+        return row[0], (row[1], row[2], row[3], row[4])
+
+    def renew(self, job_id: int, worker: str) -> bool:
+        """Push the lease deadline out by another `lease_seconds`; False if `worker` lost it."""
+        with self._tx():
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_until=? WHERE id=? AND worker=? AND status='leased'",
+                (time.time() + self.lease_seconds, job_id, worker))
+        return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        with self._tx():
+            cur = self._conn.execute(
+                "UPDATE jobs SET status='done', lease_until=NULL, last_error=NULL "
+                "WHERE id=? AND worker=? AND status='leased'",
+                (job_id, worker))
+        return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        with self._tx():
+            cur = self._conn.execute(
+                "UPDATE jobs SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_until=NULL, last_error=? WHERE id=? AND worker=? AND status='leased'",
+                (self.max_attempts, error[:500], job_id, worker))
+        return cur.rowcount == 1
+
+    def release(self, job_id: int, worker: str) -> bool:
+        """Put a leased job back to 'pending' and refund the attempt its lease used."""
+        with self._tx():
+            cur = self._conn.execute(
+                "UPDATE jobs SET status='pending', worker=NULL, lease_until=NULL, attempts=MAX(attempts-1, 0) "
+                "WHERE id=? AND worker=? AND status='leased'",
+                (job_id, worker))
+        return cur.rowcount == 1
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {s: counts.get(s, 0) for s in ("pending", "leased", "done", "failed")}